@@ -0,0 +1,166 @@
+"""
+Módulo cache.py
+
+Caché en memoria con expiración por tiempo (TTL) y límite de elementos (LRU),
+segura para usarse desde varios hilos del mismo proceso.
+
+Las invalidaciones son locales al proceso: con varios workers cada uno tiene su
+propia copia, y las demás solo se corrigen al expirar el TTL.
+
+Para no guardar un valor calculado antes de una invalidación, quien llena la
+caché toma `generacion()` antes de leer la base y la pasa a `guardar`; si la
+clave se invalidó entretanto, el valor se descarta.
+
+RegistroExpiracion es para datos que no se pueden perder antes de tiempo (las
+revocaciones de tokens): no tiene límite de elementos y cada uno se borra solo
+al llegar su propia fecha de expiración.
+"""
+
+import heapq
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+_SIN_VALOR = object()
+
+class CacheTTL:
+    def __init__(self, max_elementos: int = 1024, ttl_segundos: float = 300.0):
+        self.max_elementos = max_elementos
+        self.ttl_segundos = ttl_segundos
+        self._datos: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        # Contador de invalidaciones; por clave se recuerda la última, acotado a
+        # max_elementos. Para las claves olvidadas se usa `_piso`, la mayor
+        # generación descartada de ese registro
+        self._generacion = 0
+        self._invalidadas: "OrderedDict[Hashable, int]" = OrderedDict()
+        self._piso = 0
+        self.descartados = 0
+
+    def obtener(self, clave: Hashable, predeterminado: Any = None) -> Any:
+        """
+        Devuelve el valor guardado o `predeterminado` si no existe o ya expiró.
+        """
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._datos.get(clave, _SIN_VALOR)
+            if entrada is _SIN_VALOR or entrada[1] <= ahora:
+                if entrada is not _SIN_VALOR:
+                    del self._datos[clave]
+                self.fallos += 1
+                return predeterminado
+            self._datos.move_to_end(clave)
+            self.aciertos += 1
+            return entrada[0]
+
+    def generacion(self) -> int:
+        """
+        Marca a tomar antes de leer el valor de la base; ver `guardar`.
+        """
+        with self._lock:
+            return self._generacion
+
+    def guardar(
+        self,
+        clave: Hashable,
+        valor: Any,
+        ttl_segundos: Optional[float] = None,
+        generacion: Optional[int] = None,
+    ) -> bool:
+        """
+        Guarda el valor. Con `generacion`, lo descarta si la clave se invalidó
+        después de tomarla (el valor ya estaría desactualizado). Devuelve si se guardó.
+        """
+        expira = time.monotonic() + (self.ttl_segundos if ttl_segundos is None else ttl_segundos)
+        with self._lock:
+            if generacion is not None and self._invalidadas.get(clave, self._piso) > generacion:
+                self.descartados += 1
+                return False
+            self._datos[clave] = (valor, expira)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_elementos:
+                self._datos.popitem(last=False)
+            return True
+
+    def invalidar(self, clave: Hashable) -> None:
+        with self._lock:
+            self._datos.pop(clave, None)
+            self._generacion += 1
+            self._invalidadas[clave] = self._generacion
+            self._invalidadas.move_to_end(clave)
+            while len(self._invalidadas) > self.max_elementos:
+                _, generacion = self._invalidadas.popitem(last=False)
+                self._piso = max(self._piso, generacion)
+
+    def limpiar(self) -> None:
+        with self._lock:
+            self._datos.clear()
+            self._generacion += 1
+            self._invalidadas.clear()
+            self._piso = self._generacion
+
+    def metricas(self) -> dict:
+        with self._lock:
+            return {
+                "elementos": len(self._datos),
+                "max_elementos": self.max_elementos,
+                "ttl_segundos": self.ttl_segundos,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "descartados": self.descartados,
+            }
+
+
+class RegistroExpiracion:
+    """
+    Diccionario cuyos elementos se borran solo al expirar, nunca por espacio.
+    Las expiraciones son instantes de time.time() (como el `exp` de un JWT) y
+    se guardan en un heap para purgar las vencidas sin recorrer todo.
+    """
+    def __init__(self):
+        self._datos: Dict[Hashable, Tuple[Any, float]] = {}
+        self._expiraciones: List[Tuple[float, int, Hashable]] = []
+        # Desempata en el heap las claves con la misma expiración
+        self._contador = 0
+        self._lock = threading.Lock()
+
+    def _purgar(self, ahora: float) -> None:
+        while self._expiraciones and self._expiraciones[0][0] <= ahora:
+            expira, _, clave = heapq.heappop(self._expiraciones)
+            entrada = self._datos.get(clave)
+            # Si la clave se volvió a guardar con otra expiración, su entrada sigue en el heap
+            if entrada is not None and entrada[1] == expira:
+                del self._datos[clave]
+
+    def obtener(self, clave: Hashable, predeterminado: Any = None) -> Any:
+        ahora = time.time()
+        with self._lock:
+            self._purgar(ahora)
+            entrada = self._datos.get(clave)
+            return predeterminado if entrada is None else entrada[0]
+
+    def guardar(self, clave: Hashable, valor: Any, expira: float) -> None:
+        """
+        Guarda el valor hasta el instante `expira`; si ya pasó, no se guarda.
+        """
+        ahora = time.time()
+        with self._lock:
+            self._purgar(ahora)
+            if expira <= ahora:
+                return
+            self._datos[clave] = (valor, expira)
+            self._contador += 1
+            heapq.heappush(self._expiraciones, (expira, self._contador, clave))
+
+    def limpiar(self) -> None:
+        with self._lock:
+            self._datos.clear()
+            self._expiraciones.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._purgar(time.time())
+            return len(self._datos)
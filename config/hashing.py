@@ -0,0 +1,128 @@
+"""
+Módulo hashing.py
+
+Cifrado y verificación de contraseñas (bcrypt) en un pool de hilos dedicado y
+de tamaño fijo. Cada operación tarda cientos de milisegundos de CPU; hacerlas
+en el event loop o en el threadpool general congela el websocket y el resto de
+las peticiones durante una ráfaga de logins.
+
+El número de operaciones en curso más en espera está limitado: cuando se
+llena, se responde 503 en lugar de acumular trabajo que ya no se alcanzaría a
+atender a tiempo.
+
+Las importaciones masivas cifran en un pool de procesos aparte, para no
+ocupar el pool de los inicios de sesión.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+# Hilos que calculan bcrypt (la librería libera el GIL, así corren en paralelo)
+HASH_WORKERS = min(4, os.cpu_count() or 1)
+# Operaciones aceptadas a la vez, contando las que esperan turno
+HASH_MAX_PENDIENTES = 64
+# Procesos para cifrar las contraseñas de las importaciones masivas; dejan libres
+# los núcleos de HASH_WORKERS para que una importación no frene los logins
+HASH_PROCESOS = max(1, (os.cpu_count() or 1) - HASH_WORKERS)
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+_executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="hashing")
+_lock = threading.Lock()
+_pendientes = 0
+metricas_hashing = {"completadas": 0, "fallidas": 0, "rechazadas": 0}
+# Se crea al primer uso: la mayoría de los procesos nunca importan
+_procesos = None
+
+
+def _reservar() -> None:
+    global _pendientes
+    with _lock:
+        if _pendientes >= HASH_MAX_PENDIENTES:
+            metricas_hashing["rechazadas"] += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="El servidor está procesando demasiados inicios de sesión, intenta de nuevo en unos segundos",
+                headers={"Retry-After": "1"},
+            )
+        _pendientes += 1
+
+
+def _liberar(futuro=None) -> None:
+    global _pendientes
+    with _lock:
+        _pendientes -= 1
+        if futuro is None or futuro.cancelled() or futuro.exception() is not None:
+            metricas_hashing["fallidas"] += 1
+        else:
+            metricas_hashing["completadas"] += 1
+
+
+def _enviar(funcion, *args):
+    _reservar()
+    try:
+        futuro = _executor.submit(funcion, *args)
+    except Exception:
+        # Sin futuro: cuenta como fallida
+        _liberar()
+        raise
+    futuro.add_done_callback(_liberar)
+    return futuro
+
+
+async def hash_contrasena(contrasena: str) -> str:
+    return await asyncio.wrap_future(_enviar(pwd_context.hash, contrasena))
+
+
+async def verificar_contrasena(contrasena: str, hash_guardado: str) -> bool:
+    return await asyncio.wrap_future(_enviar(pwd_context.verify, contrasena, hash_guardado))
+
+
+def hash_contrasena_bloqueante(contrasena: str) -> str:
+    """
+    Para rutas síncronas (ya corren en el threadpool): espera el resultado del
+    pool dedicado, con el mismo límite de operaciones pendientes.
+    """
+    return _enviar(pwd_context.hash, contrasena).result()
+
+
+def _hash_en_proceso(contrasena: str) -> str:
+    return pwd_context.hash(contrasena)
+
+def hash_contrasenas_lote(contrasenas: List[str]) -> List[str]:
+    """
+    Cifra un lote de contraseñas repartido entre HASH_PROCESOS procesos.
+    Bloquea hasta terminar; llamar desde rutas síncronas.
+    """
+    global _procesos
+    if not contrasenas:
+        return []
+    with _lock:
+        if _procesos is None:
+            # spawn: un fork del servidor copiaría sus hilos y conexiones abiertas
+            _procesos = ProcessPoolExecutor(max_workers=HASH_PROCESOS, mp_context=multiprocessing.get_context("spawn"))
+    tamano_porcion = max(1, len(contrasenas) // (HASH_PROCESOS * 4))
+    return list(_procesos.map(_hash_en_proceso, contrasenas, chunksize=tamano_porcion))
+
+def cerrar_pool_procesos() -> None:
+    global _procesos
+    with _lock:
+        procesos, _procesos = _procesos, None
+    if procesos is not None:
+        procesos.shutdown(cancel_futures=True)
+
+def obtener_metricas_hashing() -> dict:
+    with _lock:
+        return {
+            "workers": HASH_WORKERS,
+            "max_pendientes": HASH_MAX_PENDIENTES,
+            "procesos_importacion": HASH_PROCESOS if _procesos is not None else 0,
+            "pendientes": _pendientes,
+            **metricas_hashing,
+        }
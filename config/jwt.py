@@ -1,20 +1,249 @@
 from datetime import datetime, timedelta
+import asyncio
+import logging
+import time
+import uuid
 from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials  # Importa HTTPAuthorizationCredentials
+from sqlalchemy import event, inspect
 from sqlalchemy.orm import Session
-from crud.usersCrud import get_user_by_nombre_usuario
-from config.db import get_db
-from typing import Optional
+from crud.usersCrud import get_user
+from config.db import get_db, AsyncSessionLocal
+from config.cache import CacheTTL, RegistroExpiracion
+from crud.transaccionsCrud import invalidar_datos_usuario
+from crud.revocacionesCrud import registrar_revocacion, obtener_revocaciones_desde, compactar_revocaciones
+from models.usersModels import Usuario
+from models.usuarioRolesModels import UsuarioRol
+from models.rolesModels import Rol
+from typing import Callable, NamedTuple, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
 
 # Configuración de JWT
 SECRET_KEY = "la_super_clave_segura_de_amuri"  # Cambia esto por una clave segura
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30  # Tiempo de expiración del token
 
+# Caché de usuarios autenticados: evita consultar tbb_usuarios en cada petición.
+# Se invalida al cambiar el estatus o los roles de un usuario; el TTL limita lo
+# que puede durar un dato viejo si el cambio se hizo en otro proceso o sin el ORM.
+CACHE_USUARIOS_MAX = 10000
+CACHE_USUARIOS_TTL_SEGUNDOS = 60
+
+# Revocación de tokens: los cerrados con /logout y los de usuarios cuyos roles
+# o estatus cambiaron. Se guardan en tbb_revocaciones_tokens y cada worker las
+# copia a memoria cada INTERVALO_REVOCACIONES_SEGUNDOS, así que en los demás
+# workers un token revocado deja de valer a más tardar en ese intervalo.
+# Basta con recordarlas lo que dura un token.
+REVOCACION_TOKENS = True
+INTERVALO_REVOCACIONES_SEGUNDOS = 2
+# Cada consulta vuelve a leer este margen antes de la anterior: una revocación
+# se registra antes de su commit y puede hacerse visible tarde
+MARGEN_REVOCACIONES_SEGUNDOS = 60
+INTERVALO_COMPACTACION_REVOCACIONES_SEGUNDOS = 3600
+
 # Esquema de seguridad para JWT
 security = HTTPBearer()  # Usa HTTPBearer en lugar de OAuth2PasswordBearer
 
+class UsuarioActual(NamedTuple):
+    """
+    Datos del usuario autenticado que se guardan en la caché.
+    """
+    id: int
+    persona_id: int
+    nombre_usuario: str
+    estatus: str
+    roles: Tuple[str, ...]
+
+class ClaimsToken(NamedTuple):
+    """
+    Datos del usuario tomados del token ya verificado, sin consultar la base.
+    """
+    id: int
+    nombre_usuario: str
+    roles: Tuple[str, ...]
+    jti: str
+    iat: float
+    exp: int
+
+# id de usuario -> UsuarioActual; por id para invalidar directo cuando cambian sus roles
+cache_usuarios = CacheTTL(max_elementos=CACHE_USUARIOS_MAX, ttl_segundos=CACHE_USUARIOS_TTL_SEGUNDOS)
+
+def cargar_usuario_actual(db: Session, usuario_id: int) -> Optional[UsuarioActual]:
+    usuario = get_user(db, id=usuario_id)
+    if usuario is None:
+        return None
+    roles = db.query(Rol.Nombre).join(UsuarioRol, UsuarioRol.Rol_ID == Rol.ID).filter(
+        UsuarioRol.Usuario_ID == usuario.id, UsuarioRol.Estatus == True
+    ).order_by(Rol.ID).all()
+    return UsuarioActual(
+        id=usuario.id,
+        persona_id=usuario.persona_id,
+        nombre_usuario=usuario.nombre_usuario,
+        estatus=usuario.estatus,
+        roles=tuple(r.Nombre for r in roles),
+    )
+
+def obtener_usuario_actual(db: Session, usuario_id: int) -> Optional[UsuarioActual]:
+    """
+    Datos del usuario desde la caché; solo consulta la base si no están o expiraron.
+    """
+    usuario = cache_usuarios.obtener(usuario_id)
+    if usuario is None:
+        usuario = cargar_usuario_actual(db, usuario_id)
+        if usuario is not None:
+            cache_usuarios.guardar(usuario_id, usuario)
+    return usuario
+
+def invalidar_usuario_actual(usuario_id: int) -> None:
+    cache_usuarios.invalidar(usuario_id)
+
+def _usuarios_modificados(session: Session) -> Tuple[Set[int], Set[int]]:
+    """
+    Ids de los usuarios cuyo nombre, estatus o roles cambian en el flush actual,
+    y de ellos, los que pueden perder permisos: sus tokens anteriores se revocan.
+    Un rol nuevo solo invalida la caché; el token anterior tiene menos roles, no más.
+    """
+    revocados = set()
+    for objeto in session.dirty:
+        if isinstance(objeto, Usuario):
+            estado = inspect(objeto)
+            if estado.attrs.nombre_usuario.history.has_changes() or estado.attrs.estatus.history.has_changes():
+                revocados.add(objeto.id)
+        elif isinstance(objeto, UsuarioRol):
+            revocados.add(objeto.Usuario_ID)
+    for objeto in session.deleted:
+        if isinstance(objeto, Usuario):
+            revocados.add(objeto.id)
+        elif isinstance(objeto, UsuarioRol):
+            revocados.add(objeto.Usuario_ID)
+    modificados = set(revocados)
+    for objeto in session.new:
+        if isinstance(objeto, UsuarioRol):
+            modificados.add(objeto.Usuario_ID)
+    modificados.discard(None)
+    revocados.discard(None)
+    return modificados, revocados
+
+def _invalidar(modificados) -> None:
+    for usuario_id in modificados:
+        invalidar_usuario_actual(usuario_id)
+        # Nombre y rol que se copian a las transacciones y sus eventos
+        invalidar_datos_usuario(usuario_id)
+
+# Sin límite de elementos: una revocación olvidada antes de tiempo volvería a
+# aceptar el token. Cada una se borra cuando ya no queda token que pueda afectar.
+# jti -> True, para los tokens cerrados antes de expirar
+tokens_revocados = RegistroExpiracion()
+# id de usuario -> momento desde el cual se aceptan sus tokens
+_revocados_desde = RegistroExpiracion()
+
+# Momento de la última copia desde tbb_revocaciones_tokens; None: aún no se copia nada
+_ultima_sincronizacion: Optional[float] = None
+
+def _aplicar_revocacion_token(jti: str, expira: float) -> None:
+    tokens_revocados.guardar(jti, True, expira)
+
+def _aplicar_revocacion_usuario(usuario_id: int, revocado_en: float) -> None:
+    anterior = _revocados_desde.obtener(usuario_id)
+    if anterior is None or anterior < revocado_en:
+        # Los tokens emitidos antes de revocado_en ya expiraron pasada su duración
+        _revocados_desde.guardar(usuario_id, revocado_en, revocado_en + ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+
+def revocar_token(db: Session, claims: ClaimsToken) -> None:
+    """
+    Cierra el token: vale de inmediato en este worker y, por la tabla de
+    revocaciones, en los demás. Hace commit.
+    """
+    if REVOCACION_TOKENS:
+        registrar_revocacion(db, revocado_en=time.time(), expira=claims.exp, jti=claims.jti)
+        db.commit()
+        _aplicar_revocacion_token(claims.jti, claims.exp)
+
+def revocar_tokens_usuario(usuario_id: int) -> None:
+    """
+    Invalida en este worker los tokens emitidos hasta ahora para el usuario (sus
+    roles ya no son los del token). Los demás lo toman de la tabla de revocaciones.
+    """
+    if REVOCACION_TOKENS:
+        _aplicar_revocacion_usuario(usuario_id, time.time())
+
+def sincronizar_revocaciones(db: Session) -> int:
+    """
+    Copia a memoria las revocaciones registradas por cualquier worker desde la
+    última copia. Devuelve cuántas leyó.
+    """
+    global _ultima_sincronizacion
+    ahora = time.time()
+    desde = None if _ultima_sincronizacion is None else _ultima_sincronizacion - MARGEN_REVOCACIONES_SEGUNDOS
+    revocaciones = obtener_revocaciones_desde(db, desde)
+    for revocacion in revocaciones:
+        if revocacion.jti is not None:
+            _aplicar_revocacion_token(revocacion.jti, revocacion.expira)
+        if revocacion.usuario_id is not None:
+            _aplicar_revocacion_usuario(revocacion.usuario_id, revocacion.revocado_en)
+    db.rollback()
+    _ultima_sincronizacion = ahora
+    return len(revocaciones)
+
+async def sincronizar_revocaciones_periodicamente(intervalo: float = INTERVALO_REVOCACIONES_SEGUNDOS) -> None:
+    """
+    Tarea de fondo que copia las revocaciones cada `intervalo` segundos y de vez
+    en cuando borra las que ya expiraron.
+    """
+    if not REVOCACION_TOKENS:
+        return
+    ultima_compactacion = time.monotonic()
+    while True:
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.run_sync(sincronizar_revocaciones)
+                if time.monotonic() - ultima_compactacion >= INTERVALO_COMPACTACION_REVOCACIONES_SEGUNDOS:
+                    ultima_compactacion = time.monotonic()
+                    await db.run_sync(compactar_revocaciones)
+        except Exception:
+            logger.exception("Error al sincronizar las revocaciones de tokens")
+        await asyncio.sleep(intervalo)
+
+def token_revocado(payload: dict) -> bool:
+    if not REVOCACION_TOKENS:
+        return False
+    if payload.get("jti") is not None and tokens_revocados.obtener(payload["jti"]):
+        return True
+    desde = _revocados_desde.obtener(payload.get("uid"))
+    return desde is not None and payload.get("iat", 0) < desde
+
+# Se invalida al hacer flush y otra vez después del commit, por si otra petición
+# volvió a llenar la caché con los datos anteriores mientras tanto
+@event.listens_for(Session, "after_flush")
+def _registrar_usuarios_modificados(session, contexto):
+    modificados, revocados = _usuarios_modificados(session)
+    if modificados:
+        session.info.setdefault("usuarios_modificados", set()).update(modificados)
+        _invalidar(modificados)
+    if revocados and REVOCACION_TOKENS:
+        # Los roles y el estatus viajan en el token: los emitidos antes del cambio
+        # dejan de valer. La revocación se guarda en la misma transacción que el cambio
+        session.info.setdefault("usuarios_revocados", set()).update(revocados)
+        ahora = time.time()
+        for usuario_id in revocados:
+            registrar_revocacion(
+                session.connection(), revocado_en=ahora,
+                expira=ahora + ACCESS_TOKEN_EXPIRE_MINUTES * 60, usuario_id=usuario_id,
+            )
+
+@event.listens_for(Session, "after_commit")
+def _invalidar_usuarios_modificados(session):
+    _invalidar(session.info.pop("usuarios_modificados", ()))
+    for usuario_id in session.info.pop("usuarios_revocados", ()):
+        revocar_tokens_usuario(usuario_id)
+
+@event.listens_for(Session, "after_rollback")
+def _descartar_usuarios_modificados(session):
+    session.info.pop("usuarios_modificados", None)
+    session.info.pop("usuarios_revocados", None)
+
 # Función para crear tokens JWT
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -22,39 +251,80 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+    # iat con fracción de segundo: un cambio de roles revoca los tokens anteriores,
+    # no el que se emita justo después
+    to_encode.update({"exp": expire, "iat": time.time(), "jti": uuid.uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-# Función para obtener el usuario actual basado en el token JWT
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
+def _credenciales_invalidas(detalle: str = "No se pudo validar las credenciales") -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="No se pudo validar las credenciales",
+        detail=detalle,
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def decodificar_token(token: str) -> dict:
+    """
+    Verifica firma, expiración y revocación; devuelve el payload o lanza 401.
+    """
     try:
-        token = credentials.credentials
-        print(f"Token recibido: {token}")  # Depuración
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        print(f"Payload decodificado: {payload}")  # Depuración
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
     except jwt.ExpiredSignatureError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="El token ha expirado",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    except jwt.JWTError as e:
-        print(f"Error al decodificar el token: {e}")  # Depuración
-        raise credentials_exception
-
-    user = get_user_by_nombre_usuario(db, nombre_usuario=username)
-    if user is None:
-        print("Usuario no encontrado en la base de datos.")  # Depuración
-        raise credentials_exception
-
-    print(f"Usuario obtenido: {user}")  # Depuración
+        raise _credenciales_invalidas("El token ha expirado")
+    except jwt.JWTError:
+        raise _credenciales_invalidas()
+    if payload.get("sub") is None:
+        raise _credenciales_invalidas()
+    if token_revocado(payload):
+        raise _credenciales_invalidas("El token fue revocado")
+    return payload
+
+def get_current_claims(credentials: HTTPAuthorizationCredentials = Depends(security)) -> ClaimsToken:
+    """
+    Usuario y roles tal como vienen en el token, sin consultar la base de datos.
+    """
+    payload = decodificar_token(credentials.credentials)
+    if not isinstance(payload.get("uid"), int) or not isinstance(payload.get("roles"), list):
+        # Token emitido antes de que se incluyeran los roles: hay que iniciar sesión de nuevo
+        raise _credenciales_invalidas()
+    return ClaimsToken(
+        id=payload["uid"],
+        nombre_usuario=payload["sub"],
+        roles=tuple(payload["roles"]),
+        jti=payload.get("jti", ""),
+        iat=payload.get("iat", 0),
+        exp=payload["exp"],
+    )
+
+def require_roles(*roles: str) -> Callable[..., ClaimsToken]:
+    """
+    Dependencia que permite el acceso solo si el token incluye alguno de `roles`:
+
+        @router.post("/ruta", dependencies=[Depends(require_roles("Gerente"))])
+    """
+    permitidos = frozenset(roles)
+
+    def verificar_roles(claims: ClaimsToken = Depends(get_current_claims)) -> ClaimsToken:
+        if permitidos.isdisjoint(claims.roles):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="No tienes permiso para realizar esta acción",
+            )
+        return claims
+
+    return verificar_roles
+
+# Función para obtener el usuario actual basado en el token JWT
+def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), db: Session = Depends(get_db)):
+    payload = decodificar_token(credentials.credentials)
+    usuario_id = payload.get("uid")
+    if not isinstance(usuario_id, int):
+        # Token emitido antes de que se incluyera el id: hay que iniciar sesión de nuevo
+        raise _credenciales_invalidas()
+
+    user = obtener_usuario_actual(db, usuario_id)
+    # Un token emitido con otro nombre (usuario renombrado) ya no vale
+    if user is None or user.nombre_usuario != payload["sub"]:
+        raise _credenciales_invalidas()
     return user
\ No newline at end of file
@@ -0,0 +1,94 @@
+"""
+Módulo limiter.py
+
+Limitador de peticiones en memoria con cubetas de fichas (token bucket), una
+por clave (nombre de usuario, IP, ...). Cada cubeta se llena a `tasa` fichas
+por segundo hasta `capacidad`; cada intento gasta una ficha.
+
+Una cubeta que lleva inactiva lo suficiente para volver a llenarse es igual a
+una nueva, así que se borra: solo se guardan las claves con actividad reciente.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Hashable
+
+from fastapi import HTTPException, Request, status
+
+class LimitadorTokens:
+    def __init__(self, capacidad: float, tasa: float, max_claves: int = 100000):
+        self.capacidad = capacidad
+        self.tasa = tasa
+        self.max_claves = max_claves
+        self._tiempo_lleno = capacidad / tasa
+        # clave -> [fichas, momento de la última actualización], de la menos a la más reciente
+        self._cubetas: "OrderedDict[Hashable, list]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.permitidos = 0
+        self.rechazados = 0
+
+    def _purgar(self, ahora: float) -> None:
+        while self._cubetas:
+            clave, (_, ultimo) = next(iter(self._cubetas.items()))
+            if ahora - ultimo < self._tiempo_lleno and len(self._cubetas) <= self.max_claves:
+                break
+            del self._cubetas[clave]
+
+    def consumir(self, clave: Hashable, costo: float = 1.0) -> float:
+        """
+        Gasta `costo` fichas de la cubeta de `clave`. Devuelve 0 si se permite,
+        o los segundos que faltan para tener fichas suficientes.
+        """
+        ahora = time.monotonic()
+        with self._lock:
+            cubeta = self._cubetas.pop(clave, None)
+            if cubeta is None:
+                fichas = self.capacidad
+            else:
+                fichas = min(self.capacidad, cubeta[0] + (ahora - cubeta[1]) * self.tasa)
+            permitido = fichas >= costo
+            if permitido:
+                fichas -= costo
+                self.permitidos += 1
+            else:
+                self.rechazados += 1
+            self._cubetas[clave] = [fichas, ahora]
+            self._purgar(ahora)
+            return 0.0 if permitido else (costo - fichas) / self.tasa
+
+    def metricas(self) -> dict:
+        with self._lock:
+            return {
+                "claves": len(self._cubetas),
+                "capacidad": self.capacidad,
+                "tasa_por_segundo": self.tasa,
+                "permitidos": self.permitidos,
+                "rechazados": self.rechazados,
+            }
+
+# Intentos por nombre de usuario: ráfaga de 5 y luego uno cada 12 segundos
+limitador_usuarios = LimitadorTokens(capacidad=5, tasa=1 / 12)
+# Intentos por IP: más holgado, varios usuarios pueden compartir la IP (kioscos, NAT)
+limitador_ips = LimitadorTokens(capacidad=30, tasa=1)
+
+def ip_cliente(request: Request) -> str:
+    return request.client.host if request.client else "desconocida"
+
+def verificar_limite(request: Request, nombre_usuario: str) -> None:
+    """
+    Lanza 429 si la IP o el nombre de usuario agotaron sus intentos. Se llama al
+    inicio de /login y /register, antes de consultar la base o calcular bcrypt.
+    """
+    espera = limitador_ips.consumir(ip_cliente(request))
+    if not espera:
+        espera = limitador_usuarios.consumir(nombre_usuario.strip().lower())
+    if espera:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Demasiados intentos, espera un momento antes de volver a intentar",
+            headers={"Retry-After": str(int(espera) + 1)},
+        )
+
+def obtener_metricas_limites() -> dict:
+    return {"usuarios": limitador_usuarios.metricas(), "ips": limitador_ips.metricas()}
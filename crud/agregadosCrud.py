@@ -0,0 +1,38 @@
+from sqlalchemy.orm import Session
+from datetime import datetime
+from typing import Iterable, NamedTuple
+from models.transaccionsModels import Transaccion, TipoTransaccion, MetodoPago, EstatusTransaccion
+from crud.estadisticasCrud import aplicar_cambios_estadisticas
+from crud.resumenesCrud import aplicar_cambios_resumen
+
+class CambioTransaccion(NamedTuple):
+    """
+    Aporte de una transacción a los agregados: signo es 1 al sumarla y -1 al retirarla.
+    """
+    fecha_registro: datetime
+    tipo_transaccion: TipoTransaccion
+    metodo_pago: MetodoPago
+    estatus: EstatusTransaccion
+    monto: float
+    signo: int = 1
+
+def cambio_desde_transaccion(transaccion: Transaccion, signo: int = 1) -> CambioTransaccion:
+    return CambioTransaccion(
+        fecha_registro=transaccion.fecha_registro,
+        tipo_transaccion=transaccion.tipo_transaccion,
+        metodo_pago=transaccion.metodo_pago,
+        estatus=transaccion.estatus,
+        monto=transaccion.monto,
+        signo=signo
+    )
+
+def aplicar_cambios(db: Session, cambios: Iterable[CambioTransaccion]) -> None:
+    """
+    Ajusta todos los agregados (totales y resúmenes por periodo) sin hacer commit,
+    para que queden en la misma transacción que la escritura que los origina.
+    """
+    cambios = list(cambios)
+    if not cambios:
+        return
+    aplicar_cambios_estadisticas(db, cambios)
+    aplicar_cambios_resumen(db, cambios)
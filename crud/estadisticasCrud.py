@@ -0,0 +1,143 @@
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, case, update, insert
+from sqlalchemy.dialects import mysql, sqlite, postgresql
+from datetime import datetime
+from typing import Iterable, Tuple
+from models.transaccionsModels import Transaccion, TipoTransaccion, EstatusTransaccion
+from models.estadisticasModels import EstadisticasTransacciones
+
+# Solo existe un registro de totales
+ESTADISTICAS_ID = 1
+
+def _contribucion(tipo_transaccion, estatus, monto: float) -> Tuple[float, float]:
+    """
+    Devuelve lo que una transacción aporta a (ingresos, egresos).
+    Solo las transacciones pagadas cuentan para los montos.
+    """
+    if EstatusTransaccion(estatus) != EstatusTransaccion.PAGADA:
+        return 0.0, 0.0
+    if TipoTransaccion(tipo_transaccion) == TipoTransaccion.INGRESO:
+        return monto, 0.0
+    return 0.0, monto
+
+def _sumar_estadisticas(db: Session, delta_ingresos: float, delta_egresos: float, delta_cantidad: int) -> None:
+    """
+    Suma los deltas al registro de totales en una sola sentencia; si el registro
+    no existe lo crea con ellos. La sentencia bloquea el registro hasta el commit.
+    """
+    tabla = EstadisticasTransacciones.__table__
+    fila = {
+        "id": ESTADISTICAS_ID,
+        "total_ingresos": delta_ingresos,
+        "total_egresos": delta_egresos,
+        "transacciones_totales": delta_cantidad,
+        "fecha_actualizacion": datetime.now(),
+    }
+    incrementos = {
+        "total_ingresos": tabla.c.total_ingresos + delta_ingresos,
+        "total_egresos": tabla.c.total_egresos + delta_egresos,
+        "transacciones_totales": tabla.c.transacciones_totales + delta_cantidad,
+        "fecha_actualizacion": fila["fecha_actualizacion"],
+    }
+    dialecto = db.get_bind().dialect.name
+
+    if dialecto == "mysql":
+        db.execute(mysql.insert(tabla).values(**fila).on_duplicate_key_update(**incrementos))
+        return
+
+    if dialecto in ("sqlite", "postgresql"):
+        modulo = sqlite if dialecto == "sqlite" else postgresql
+        db.execute(modulo.insert(tabla).values(**fila).on_conflict_do_update(index_elements=["id"], set_=incrementos))
+        return
+
+    resultado = db.execute(update(tabla).where(tabla.c.id == ESTADISTICAS_ID).values(**incrementos))
+    if resultado.rowcount == 0:
+        db.execute(insert(tabla).values(**fila))
+
+def bloquear_estadisticas(db: Session) -> None:
+    """
+    Toma el bloqueo del registro de totales hasta el commit. Todas las escrituras
+    de transacciones pasan por él, así que las reconstrucciones (totales y
+    resúmenes) lo toman primero para no mezclarse con altas simultáneas.
+    """
+    _sumar_estadisticas(db, 0.0, 0.0, 0)
+    db.query(EstadisticasTransacciones.id).filter(
+        EstadisticasTransacciones.id == ESTADISTICAS_ID
+    ).with_for_update().one()
+
+def aplicar_cambios_estadisticas(db: Session, cambios: Iterable) -> None:
+    """
+    Ajusta los totales acumulados dentro de la transacción abierta en `db`.
+    Recibe objetos CambioTransaccion (ver crud.agregadosCrud).
+
+    No hace commit: quien llama confirma el alta de la transacción y el ajuste
+    de los totales juntos. El registro de totales se siembra al crear la tabla
+    (seeders.estadisticasSeeder).
+    """
+    delta_ingresos = 0.0
+    delta_egresos = 0.0
+    delta_cantidad = 0
+    for cambio in cambios:
+        ingreso, egreso = _contribucion(cambio.tipo_transaccion, cambio.estatus, cambio.monto)
+        delta_ingresos += cambio.signo * ingreso
+        delta_egresos += cambio.signo * egreso
+        delta_cantidad += cambio.signo
+
+    # Incremento atómico en la base de datos para no perder escrituras concurrentes.
+    # Se ejecuta aunque los deltas sean cero: toma el bloqueo que espera una
+    # reconstrucción en curso antes de tocar también los resúmenes
+    _sumar_estadisticas(db, delta_ingresos, delta_egresos, delta_cantidad)
+
+def reconstruir_estadisticas(db: Session, commit: bool = True) -> EstadisticasTransacciones:
+    """
+    Recalcula los totales recorriendo toda la tabla de transacciones y los guarda.
+
+    Primero bloquea el registro de totales: las altas que ya lo ajustaron están
+    confirmadas y entran en la suma, y las que siguen esperan y aplican su delta
+    sobre el resultado.
+    """
+    bloquear_estadisticas(db)
+    pagada = Transaccion.estatus == EstatusTransaccion.PAGADA
+    totales = db.query(
+        func.coalesce(func.sum(case(
+            (pagada & (Transaccion.tipo_transaccion == TipoTransaccion.INGRESO), Transaccion.monto),
+            else_=0
+        )), 0),
+        func.coalesce(func.sum(case(
+            (pagada & (Transaccion.tipo_transaccion == TipoTransaccion.EGRESO), Transaccion.monto),
+            else_=0
+        )), 0),
+        func.count(Transaccion.id)
+    ).one()
+
+    estadisticas = db.get(EstadisticasTransacciones, ESTADISTICAS_ID, populate_existing=True)
+    estadisticas.total_ingresos = float(totales[0])
+    estadisticas.total_egresos = float(totales[1])
+    estadisticas.transacciones_totales = int(totales[2])
+    estadisticas.fecha_actualizacion = datetime.now()
+
+    if commit:
+        db.commit()
+        db.refresh(estadisticas)
+    else:
+        db.flush()
+    return estadisticas
+
+def obtener_estadisticas(db: Session) -> dict:
+    """
+    Obtiene los totales acumulados leyendo un único registro.
+    """
+    estadisticas = db.get(EstadisticasTransacciones, ESTADISTICAS_ID)
+    if estadisticas is None:
+        estadisticas = reconstruir_estadisticas(db)
+
+    return {
+        "total_ingresos": estadisticas.total_ingresos,
+        "total_egresos": estadisticas.total_egresos,
+        "balance_general": estadisticas.total_ingresos - estadisticas.total_egresos,
+        "transacciones_totales": estadisticas.transacciones_totales
+    }
+
+async def obtener_estadisticas_async(db: AsyncSession) -> dict:
+    return await db.run_sync(obtener_estadisticas)
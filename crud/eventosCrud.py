@@ -0,0 +1,133 @@
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, delete
+from fastapi.encoders import jsonable_encoder
+from datetime import datetime, timedelta
+import asyncio
+import logging
+from typing import List, Optional
+from models.eventosModels import EventoTransaccion
+from config.db import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Clave en db.info con los eventos registrados en la sesión que aún no se notifican
+EVENTOS_PENDIENTES = "eventos_pendientes"
+# Tiempo que se conservan los eventos para reenviarlos
+RETENCION_EVENTOS = timedelta(days=1)
+INTERVALO_COMPACTACION_SEGUNDOS = 3600
+# Si un cliente perdió más eventos que estos, es más barato que recargue todo
+MAX_EVENTOS_REPRODUCCION = 1000
+# Los ids se asignan al insertar pero se hacen visibles al commit, que puede
+# llegar en otro orden: un evento con id menor al último que vio el cliente
+# puede confirmarse después. Al reproducir se vuelve a mandar lo registrado en
+# esta ventana antes de ese último evento; el cliente descarta los event_id
+# que ya aplicó. Debe cubrir la transacción más larga (lock wait de InnoDB: 50 s)
+VENTANA_REPRODUCCION = timedelta(seconds=60)
+# Tope aparte para los eventos de la ventana: no cuentan contra el límite de
+# eventos nuevos. Si hay más, se reenvían los más cercanos al último evento,
+# que son los que pueden haberse confirmado tarde
+MAX_EVENTOS_VENTANA = 1000
+
+def registrar_evento(db: Session, accion: str, **datos) -> EventoTransaccion:
+    """
+    Agrega el evento a la transacción abierta en `db`, sin hacer commit: se
+    guarda junto con el cambio que lo origina o no se guarda.
+    """
+    evento = EventoTransaccion(accion=accion, datos=jsonable_encoder(datos), fecha_registro=datetime.now())
+    db.add(evento)
+    db.info.setdefault(EVENTOS_PENDIENTES, []).append(evento)
+    return evento
+
+def tomar_eventos(db) -> List[EventoTransaccion]:
+    """
+    Devuelve y olvida los eventos registrados en la sesión (después del commit ya tienen id).
+    """
+    return db.info.pop(EVENTOS_PENDIENTES, [])
+
+def descartar_eventos(db: Session) -> None:
+    db.info.pop(EVENTOS_PENDIENTES, None)
+
+def mensaje_evento(evento: EventoTransaccion) -> dict:
+    return {"action": evento.accion, **evento.datos, "event_id": evento.id}
+
+def obtener_eventos_desde(
+    db: Session, ultimo_evento_id: int, limite: int = MAX_EVENTOS_REPRODUCCION
+) -> Optional[List[EventoTransaccion]]:
+    """
+    Eventos posteriores a `ultimo_evento_id`, en orden, más los de la
+    VENTANA_REPRODUCCION anterior a él (ver arriba); el cliente ignora los que
+    ya tiene. Devuelve None si ya no se pueden reconstruir (se compactaron o los
+    posteriores son más de `limite`) y el cliente debe recargar todo.
+    """
+    minimo, maximo = db.query(func.min(EventoTransaccion.id), func.max(EventoTransaccion.id)).one()
+    if maximo is None:
+        return [] if ultimo_evento_id == 0 else None
+    if ultimo_evento_id > maximo:
+        return None
+    if minimo > ultimo_evento_id + 1:
+        return None
+
+    eventos = (
+        db.query(EventoTransaccion)
+        .filter(EventoTransaccion.id > ultimo_evento_id)
+        .order_by(EventoTransaccion.id)
+        .limit(limite + 1)
+        .all()
+    )
+    if len(eventos) > limite:
+        return None
+
+    referencia = db.get(EventoTransaccion, ultimo_evento_id)
+    if referencia is None:
+        return eventos
+    ventana = (
+        db.query(EventoTransaccion)
+        .filter(
+            # El rango de ids acota el recorrido por la llave primaria
+            EventoTransaccion.id > ultimo_evento_id - MAX_EVENTOS_VENTANA,
+            EventoTransaccion.id < ultimo_evento_id,
+            EventoTransaccion.fecha_registro >= referencia.fecha_registro - VENTANA_REPRODUCCION,
+        )
+        .order_by(EventoTransaccion.id.desc())
+        .limit(MAX_EVENTOS_VENTANA)
+        .all()
+    )
+    ventana.reverse()
+    return ventana + eventos
+
+async def obtener_eventos_desde_async(
+    db: AsyncSession, ultimo_evento_id: int, limite: int = MAX_EVENTOS_REPRODUCCION
+) -> Optional[List[EventoTransaccion]]:
+    return await db.run_sync(obtener_eventos_desde, ultimo_evento_id, limite)
+
+def compactar_eventos(db: Session, retencion: timedelta = RETENCION_EVENTOS) -> int:
+    """
+    Borra los eventos más viejos que la retención. Siempre se conserva el último
+    para saber hasta qué id hubo eventos. Devuelve cuántos se borraron.
+    """
+    maximo = db.query(func.max(EventoTransaccion.id)).scalar()
+    if maximo is None:
+        return 0
+    resultado = db.execute(
+        delete(EventoTransaccion).where(
+            EventoTransaccion.fecha_registro < datetime.now() - retencion,
+            EventoTransaccion.id < maximo
+        )
+    )
+    db.commit()
+    return resultado.rowcount
+
+async def compactar_periodicamente(intervalo: float = INTERVALO_COMPACTACION_SEGUNDOS) -> None:
+    """
+    Tarea de fondo que compacta la bandeja de eventos cada `intervalo` segundos.
+    """
+    while True:
+        await asyncio.sleep(intervalo)
+        try:
+            async with AsyncSessionLocal() as db:
+                borrados = await db.run_sync(compactar_eventos)
+            if borrados:
+                logger.info("Eventos de transacciones compactados: %s", borrados)
+        except Exception:
+            logger.exception("Error al compactar eventos de transacciones")
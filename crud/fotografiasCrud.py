@@ -0,0 +1,282 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import update, insert
+from sqlalchemy.dialects import mysql, sqlite, postgresql
+from fastapi import HTTPException, status
+from starlette.concurrency import run_in_threadpool
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import AsyncIterator, Dict, NamedTuple, Optional, Tuple
+import asyncio
+import glob
+import hashlib
+import logging
+import os
+import re
+import threading
+import uuid
+from models.fotografiasModels import Fotografia
+
+logger = logging.getLogger(__name__)
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow es opcional: sin él se sirve siempre la fotografía original
+    Image = None
+
+# Las fotografías se guardan como uploads/<2 primeros caracteres del hash>/<sha256>.<ext>:
+# el mismo contenido siempre cae en el mismo archivo y se guarda una sola vez
+DIRECTORIO_FOTOGRAFIAS = "uploads"
+TAMANO_MAXIMO_FOTOGRAFIA = 5 * 1024 * 1024
+# Se acumula hasta este tamaño antes de escribir en disco (en el threadpool)
+TAMANO_BLOQUE_ESCRITURA = 256 * 1024
+# Bytes necesarios para reconocer el tipo por su firma
+TAMANO_FIRMA = 12
+
+# Variantes reducidas (lado mayor en pixeles): miniaturas para listas y vista de detalle.
+# Se generan la primera vez que se piden y quedan en disco
+TAMANOS_VARIANTES = (64, 160, 480)
+DIRECTORIO_VARIANTES = os.path.join(DIRECTORIO_FOTOGRAFIAS, "variantes")
+VARIANTES_WORKERS = 2
+
+_RUTA_DIRECCIONADA = re.compile(r"^[0-9a-f]{64}$")
+_FORMATOS_PIL = {"jpg": "JPEG", "png": "PNG", "webp": "WEBP"}
+
+_pool_variantes = ThreadPoolExecutor(max_workers=VARIANTES_WORKERS, thread_name_prefix="variantes")
+# ruta de la variante -> generación en curso, para no generar la misma dos veces a la vez
+_variantes_en_proceso: Dict[str, Future] = {}
+_lock_variantes = threading.Lock()
+
+class FotografiaSubida(NamedTuple):
+    sha256: str
+    ruta: str
+    tipo_contenido: str
+    tamano: int
+    temporal: str  # archivo con el contenido recibido, hasta moverlo a `ruta`
+
+def _detectar_tipo(cabecera: bytes) -> Optional[Tuple[str, str]]:
+    """
+    Tipo MIME y extensión según los primeros bytes; no se confía en el Content-Type del cliente.
+    """
+    if cabecera.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg", "jpg"
+    if cabecera.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png", "png"
+    if cabecera[:4] == b"RIFF" and cabecera[8:12] == b"WEBP":
+        return "image/webp", "webp"
+    return None
+
+def ruta_fotografia(sha256: str, extension: str) -> str:
+    return os.path.join(DIRECTORIO_FOTOGRAFIAS, sha256[:2], f"{sha256}.{extension}")
+
+def es_sha256(texto: str) -> bool:
+    return bool(_RUTA_DIRECCIONADA.match(texto))
+
+def sha256_de_ruta(ruta: str) -> Optional[str]:
+    """
+    Hash de una ruta guardada por contenido; None para las fotografías
+    anteriores, guardadas con un nombre aleatorio.
+    """
+    nombre = os.path.splitext(os.path.basename(ruta))[0]
+    return nombre if es_sha256(nombre) else None
+
+def _escribir_bloque(archivo, sha256, bloque: bytearray) -> None:
+    sha256.update(bloque)
+    archivo.write(bloque)
+
+def _abrir_temporal() -> Tuple[str, object]:
+    directorio = os.path.join(DIRECTORIO_FOTOGRAFIAS, "tmp")
+    os.makedirs(directorio, exist_ok=True)
+    temporal = os.path.join(directorio, f"{uuid.uuid4().hex}.parcial")
+    return temporal, open(temporal, "wb")
+
+def descartar_temporal(subida: FotografiaSubida) -> None:
+    if os.path.exists(subida.temporal):
+        os.remove(subida.temporal)
+
+async def recibir_fotografia(partes: AsyncIterator[bytes]) -> FotografiaSubida:
+    """
+    Recibe la imagen por partes a un archivo temporal, calculando el SHA-256 en el
+    camino. El límite de tamaño y el tipo se revisan mientras llegan los bytes:
+    una subida inválida se corta sin haberla leído completa.
+    """
+    temporal, archivo = await run_in_threadpool(_abrir_temporal)
+    sha256 = hashlib.sha256()
+    pendiente = bytearray()
+    tamano = 0
+    tipo = None
+    try:
+        async for parte in partes:
+            tamano += len(parte)
+            if tamano > TAMANO_MAXIMO_FOTOGRAFIA:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail=f"La fotografía no puede pesar más de {TAMANO_MAXIMO_FOTOGRAFIA // (1024 * 1024)} MB",
+                )
+            pendiente += parte
+            if tipo is None and len(pendiente) >= TAMANO_FIRMA:
+                tipo = _detectar_tipo(bytes(pendiente[:TAMANO_FIRMA]))
+                if tipo is None:
+                    break
+            if len(pendiente) >= TAMANO_BLOQUE_ESCRITURA:
+                await run_in_threadpool(_escribir_bloque, archivo, sha256, pendiente)
+                pendiente.clear()
+        if tipo is None:
+            tipo = _detectar_tipo(bytes(pendiente))
+        if tipo is None:
+            raise HTTPException(
+                status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                detail="La fotografía debe ser una imagen JPEG, PNG o WEBP",
+            )
+        if pendiente:
+            await run_in_threadpool(_escribir_bloque, archivo, sha256, pendiente)
+        await run_in_threadpool(archivo.close)
+    except BaseException:
+        archivo.close()
+        os.remove(temporal)
+        raise
+
+    digest = sha256.hexdigest()
+    tipo_contenido, extension = tipo
+    return FotografiaSubida(digest, ruta_fotografia(digest, extension), tipo_contenido, tamano, temporal)
+
+def _sumar_referencia(db: Session, subida: FotografiaSubida) -> None:
+    """
+    Crea el registro con una referencia o suma una al existente, en una sola
+    sentencia cuando el motor tiene upsert. La sentencia bloquea el registro
+    hasta el commit.
+    """
+    tabla = Fotografia.__table__
+    fila = {
+        "sha256": subida.sha256,
+        "ruta": subida.ruta,
+        "tipo_contenido": subida.tipo_contenido,
+        "tamano": subida.tamano,
+        "referencias": 1,
+        "fecha_registro": datetime.now(),
+    }
+    dialecto = db.get_bind().dialect.name
+
+    if dialecto == "mysql":
+        sentencia = mysql.insert(tabla).values(**fila)
+        db.execute(sentencia.on_duplicate_key_update(referencias=tabla.c.referencias + 1))
+        return
+
+    if dialecto in ("sqlite", "postgresql"):
+        modulo = sqlite if dialecto == "sqlite" else postgresql
+        sentencia = modulo.insert(tabla).values(**fila)
+        db.execute(sentencia.on_conflict_do_update(
+            index_elements=["sha256"], set_={"referencias": tabla.c.referencias + 1}
+        ))
+        return
+
+    resultado = db.execute(
+        update(Fotografia).where(Fotografia.sha256 == subida.sha256).values(referencias=Fotografia.referencias + 1)
+    )
+    if resultado.rowcount == 0:
+        db.execute(insert(Fotografia).values(**fila))
+
+def registrar_fotografia(db: Session, subida: FotografiaSubida) -> bool:
+    """
+    Suma una referencia y coloca el archivo en su ruta definitiva. No hace
+    commit. Devuelve True si ese contenido ya estaba guardado.
+    """
+    _sumar_referencia(db, subida)
+    # Con el registro ya bloqueado: una limpieza simultánea del mismo contenido
+    # espera al commit y no puede borrar el archivo después de colocarlo
+    duplicada = os.path.exists(subida.ruta)
+    if duplicada:
+        descartar_temporal(subida)
+    else:
+        os.makedirs(os.path.dirname(subida.ruta), exist_ok=True)
+        os.replace(subida.temporal, subida.ruta)
+    return duplicada
+
+def quitar_referencia(db: Session, ruta: str) -> None:
+    """
+    Resta una referencia; el archivo se borra con limpiar_fotografia después del commit.
+    """
+    sha256 = sha256_de_ruta(ruta)
+    if sha256 is not None:
+        db.execute(
+            update(Fotografia)
+            .where(Fotografia.sha256 == sha256, Fotografia.referencias > 0)
+            .values(referencias=Fotografia.referencias - 1)
+        )
+
+def limpiar_fotografia(db: Session, ruta: str) -> bool:
+    """
+    Borra el archivo y su registro si ninguna persona lo usa. Hace commit.
+    Devuelve True si se borró.
+    """
+    sha256 = sha256_de_ruta(ruta)
+    if sha256 is None:
+        # Fotografía anterior al guardado por contenido: no se comparte
+        if os.path.exists(ruta):
+            os.remove(ruta)
+            return True
+        return False
+
+    fotografia = (
+        db.query(Fotografia)
+        .filter(Fotografia.sha256 == sha256, Fotografia.referencias == 0)
+        .with_for_update()
+        .first()
+    )
+    if fotografia is None:
+        db.commit()
+        return False
+    if os.path.exists(fotografia.ruta):
+        os.remove(fotografia.ruta)
+    for variante in glob.glob(os.path.join(DIRECTORIO_VARIANTES, sha256[:2], f"{sha256}-*")):
+        os.remove(variante)
+    db.delete(fotografia)
+    db.commit()
+    return True
+
+def ruta_variante(ruta_original: str, tamano: int) -> str:
+    nombre, extension = os.path.splitext(os.path.basename(ruta_original))
+    return os.path.join(DIRECTORIO_VARIANTES, nombre[:2], f"{nombre}-{tamano}{extension}")
+
+def _generar_variante(ruta_original: str, destino: str, tamano: int) -> str:
+    formato = _FORMATOS_PIL[os.path.splitext(ruta_original)[1].lstrip(".")]
+    with Image.open(ruta_original) as imagen:
+        imagen = ImageOps.exif_transpose(imagen)  # respeta la orientación de la cámara
+        imagen.thumbnail((tamano, tamano))
+        if formato == "JPEG" and imagen.mode not in ("RGB", "L"):
+            imagen = imagen.convert("RGB")
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        # Se escribe aparte y se renombra: nunca se sirve una variante a medias
+        temporal = f"{destino}.{uuid.uuid4().hex}.parcial"
+        imagen.save(temporal, format=formato, **({"quality": 85} if formato != "PNG" else {"optimize": True}))
+    os.replace(temporal, destino)
+    return destino
+
+def _terminar_variante(destino: str) -> None:
+    with _lock_variantes:
+        _variantes_en_proceso.pop(destino, None)
+
+async def obtener_variante(ruta_original: str, tamano: int) -> Optional[str]:
+    """
+    Ruta de la variante de `tamano`, generándola en el pool de fondo si aún no
+    existe. None si no se puede generar (sin Pillow o imagen dañada).
+    """
+    if Image is None:
+        return None
+    destino = ruta_variante(ruta_original, tamano)
+    if os.path.exists(destino):
+        return destino
+
+    with _lock_variantes:
+        futuro = _variantes_en_proceso.get(destino)
+        nuevo = futuro is None
+        if nuevo:
+            futuro = _pool_variantes.submit(_generar_variante, ruta_original, destino, tamano)
+            _variantes_en_proceso[destino] = futuro
+    if nuevo:
+        futuro.add_done_callback(lambda _futuro: _terminar_variante(destino))
+
+    try:
+        return await asyncio.wrap_future(futuro)
+    except Exception:
+        logger.exception("No se pudo generar la variante %s", destino)
+        return None
@@ -1,6 +1,7 @@
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, BinaryIO, Iterable, Iterator, List, Set, Tuple
 from sqlalchemy.orm import Session
-from fastapi import HTTPException, UploadFile
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import HTTPException
 import models.personasModels
 import models.usersModels
 import models.usuarioRolesModels
@@ -8,24 +9,18 @@ from models.usuarioRolesModels import UsuarioRol
 import models.rolesModels
 from models.rolesModels import Rol
 import schemas.personaSchemas
-from sqlalchemy.exc import SQLAlchemyError
-import os
-import uuid
-from sqlalchemy import func
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
+from pydantic import ValidationError
+import csv
+import io
+import json
+import time
+import unicodedata
+from sqlalchemy import func, insert, or_
 from datetime import datetime
-
-def save_image(image: UploadFile) -> Optional[str]:
-    if not image:
-        return None
-    upload_dir = "uploads"
-    if not os.path.exists(upload_dir):
-        os.makedirs(upload_dir)
-    file_extension = image.filename.split(".")[-1]
-    file_name = f"{uuid.uuid4()}.{file_extension}"
-    file_path = os.path.join(upload_dir, file_name)
-    with open(file_path, "wb") as buffer:
-        buffer.write(image.file.read())
-    return file_path
+from config.hashing import hash_contrasenas_lote
+from crud.transaccionsCrud import insertar_filas_con_ids
+from crud.fotografiasCrud import FotografiaSubida, registrar_fotografia, quitar_referencia, limpiar_fotografia
 
 def get_personas(db: Session, skip: int = 0, limit: int = 10):
     return db.query(models.personasModels.Persona).offset(skip).limit(limit).all()
@@ -33,25 +28,76 @@ def get_personas(db: Session, skip: int = 0, limit: int = 10):
 def get_persona(db: Session, id: int):
     return db.query(models.personasModels.Persona).filter(models.personasModels.Persona.id == id).first()
 
-def generar_nombre_usuario(nombre: str, primer_apellido: str, segundo_apellido: str, db: Session) -> str:
-    base_name = (nombre[0] + primer_apellido[:3] + segundo_apellido[:3]).lower()[:7]
-    nombre_usuario = base_name
-    counter = 1
-    
-    while db.query(models.usersModels.User).filter(
-        func.lower(models.usersModels.User.nombre_usuario) == nombre_usuario.lower()
-    ).first():
+async def get_persona_async(db: AsyncSession, id: int):
+    return await db.get(models.personasModels.Persona, id)
+
+# Reintentos de create_persona cuando otro registro simultáneo ocupa el mismo nombre de usuario
+MAX_INTENTOS_NOMBRE_USUARIO = 5
+
+def _nombre_base(nombre: str, primer_apellido: str, segundo_apellido: Optional[str]) -> str:
+    return (nombre[0] + primer_apellido[:3] + (segundo_apellido or "")[:3]).lower()[:7]
+
+def _clave_nombre(nombre_usuario: str) -> str:
+    """
+    Forma en que la intercalación de MySQL (utf8mb4, *_ai_ci) compara los nombres:
+    sin mayúsculas, sin acentos (ñ como n) y sin espacios al final. Dos nombres
+    con la misma clave chocan en uq_nombre_usuario.
+    """
+    descompuesto = unicodedata.normalize("NFKD", nombre_usuario)
+    return "".join(c for c in descompuesto if not unicodedata.combining(c)).casefold().rstrip(" ")
+
+def _nombres_ocupados(db: Session, prefijos: Set[str]) -> Set[str]:
+    """
+    Una sola consulta por rango del índice único: todos los nombres que empiezan
+    con alguno de los prefijos (la intercalación de MySQL ya compara sin
+    mayúsculas ni acentos). Devuelve sus claves (_clave_nombre).
+    """
+    columna = models.usersModels.Usuario.nombre_usuario
+    if not prefijos:
+        return set()
+    return {
+        _clave_nombre(fila.nombre_usuario)
+        for fila in db.query(columna).filter(or_(*(columna.startswith(p, autoescape=True) for p in prefijos)))
+    }
+
+def _primer_nombre_libre(base_name: str, ocupados: Set[str]) -> Optional[str]:
+    if _clave_nombre(base_name) not in ocupados:
+        return base_name
+    for counter in range(1, 1000):  # Límite de seguridad
         nombre_usuario = f"{base_name[:6]}{counter}"
-        counter += 1
-        if counter > 999:  # Límite de seguridad
-            raise HTTPException(
-                status_code=500,
-                detail="No se pudo generar un nombre de usuario único después de múltiples intentos"
-            )
+        if _clave_nombre(nombre_usuario) not in ocupados:
+            return nombre_usuario
+    return None
+
+def generar_nombre_usuario(nombre: str, primer_apellido: str, segundo_apellido: str, db: Session) -> str:
+    base_name = _nombre_base(nombre, primer_apellido, segundo_apellido)
+    nombre_usuario = _primer_nombre_libre(base_name, _nombres_ocupados(db, {base_name[:6]}))
+    if nombre_usuario is None:
+        raise HTTPException(
+            status_code=500,
+            detail="No se pudo generar un nombre de usuario único después de múltiples intentos"
+        )
     return nombre_usuario
 
 
 def create_persona(db: Session, persona: schemas.personaSchemas.PersonaCreate):
+    # La fotografía se sube después, con PUT /personas/{id}/fotografia
+    fotografia_path = None
+    for intento in range(MAX_INTENTOS_NOMBRE_USUARIO):
+        try:
+            return _insertar_persona(db, persona, fotografia_path)
+        except IntegrityError as e:
+            db.rollback()
+            # Otro registro tomó el mismo nombre entre la consulta y el insert:
+            # se vuelve a asignar en una transacción nueva, que ya lo ve ocupado
+            if "nombre_usuario" in str(e.orig) and intento + 1 < MAX_INTENTOS_NOMBRE_USUARIO:
+                continue
+            raise HTTPException(
+                status_code=500,
+                detail=f"Error en el registro: {str(e)}"
+            ) from e
+
+def _insertar_persona(db: Session, persona: schemas.personaSchemas.PersonaCreate, fotografia_path: Optional[str]):
     try:
         nombre_usuario = generar_nombre_usuario(
             persona.nombre,
@@ -60,8 +106,6 @@ def create_persona(db: Session, persona: schemas.personaSchemas.PersonaCreate):
             db
         )
 
-        fotografia_path = save_image(persona.fotografia)
-
         db_persona = models.personasModels.Persona(
             titulo_cortesia=persona.titulo_cortesia,
             nombre=persona.nombre,
@@ -77,7 +121,7 @@ def create_persona(db: Session, persona: schemas.personaSchemas.PersonaCreate):
         db.add(db_persona)
         db.flush()  # para obtener el ID
 
-        db_usuario = models.usersModels.User(
+        db_usuario = models.usersModels.Usuario(
             persona_id=db_persona.id,
             nombre_usuario=nombre_usuario,
             correo_electronico=persona.correo_electronico,
@@ -116,6 +160,8 @@ def create_persona(db: Session, persona: schemas.personaSchemas.PersonaCreate):
             "nombre_usuario": db_usuario.nombre_usuario
         }
 
+    except IntegrityError:
+        raise
     except Exception as e:
         db.rollback()
         raise HTTPException(
@@ -130,12 +176,7 @@ def update_persona(db: Session, id: int, persona_data: schemas.personaSchemas.Pe
     if db_persona is None:
         return None
 
-    # Guardar la nueva imagen si se proporciona
-    if persona_data.fotografia:
-        fotografia_path = save_image(persona_data.fotografia)
-        db_persona.fotografia = fotografia_path
-
-    # Actualizar solo los campos que no sean None
+    # Actualizar solo los campos que no sean None (la fotografía tiene su propio endpoint)
     update_data = persona_data.dict(exclude_unset=True, exclude={"fotografia"})
     for field, value in update_data.items():
         setattr(db_persona, field, value)
@@ -152,10 +193,229 @@ def delete_persona(db: Session, id: int):
     if db_persona is None:
         raise HTTPException(status_code=404, detail="Persona no encontrada")
 
-    # Eliminar la imagen asociada si existe
-    if db_persona.fotografia and os.path.exists(db_persona.fotografia):
-        os.remove(db_persona.fotografia)
+    # La imagen puede ser compartida con otras personas: solo se borra si ya nadie la usa
+    fotografia = db_persona.fotografia
+    if fotografia:
+        quitar_referencia(db, fotografia)
 
     db.delete(db_persona)
     db.commit()
-    return {"message": f"Persona con ID {id} eliminada correctamente"}
\ No newline at end of file
+    if fotografia:
+        limpiar_fotografia(db, fotografia)
+    return {"message": f"Persona con ID {id} eliminada correctamente"}
+
+def asignar_fotografia(db: Session, id: int, subida: FotografiaSubida) -> Dict[str, Any]:
+    """
+    Asigna a la persona la fotografía recibida y libera la anterior.
+    """
+    db_persona = db.get(models.personasModels.Persona, id)
+    if db_persona is None:
+        raise HTTPException(status_code=404, detail="Persona no encontrada")
+
+    anterior = db_persona.fotografia
+    duplicada = registrar_fotografia(db, subida)
+    if anterior:
+        quitar_referencia(db, anterior)
+    db_persona.fotografia = subida.ruta
+    db.commit()
+    if anterior and anterior != subida.ruta:
+        limpiar_fotografia(db, anterior)
+
+    return {
+        "id": id,
+        "fotografia": subida.ruta,
+        "sha256": subida.sha256,
+        "tipo_contenido": subida.tipo_contenido,
+        "tamano": subida.tamano,
+        "duplicada": duplicada,
+    }
+
+
+# --- Importación masiva de personas (CSV / NDJSON) ---
+
+# Filas que se cifran e insertan juntas
+TAMANO_LOTE_IMPORTACION = 200
+
+def leer_filas_importacion(archivo: BinaryIO, formato: str) -> Iterator[Tuple[int, Any]]:
+    """
+    Recorre el archivo sin cargarlo completo. Devuelve (número de fila, datos),
+    o (número de fila, excepción) si la línea de NDJSON no es JSON válido.
+    """
+    texto = io.TextIOWrapper(archivo, encoding="utf-8-sig", newline="")
+    try:
+        if formato == "csv":
+            for numero, fila in enumerate(csv.DictReader(texto), start=1):
+                # Celdas vacías como valores ausentes, para que apliquen los opcionales
+                yield numero, {k.strip(): (v.strip() or None) for k, v in fila.items() if k and isinstance(v, str)}
+        else:
+            numero = 0
+            for linea in texto:
+                if not linea.strip():
+                    continue
+                numero += 1
+                try:
+                    yield numero, json.loads(linea)
+                except ValueError as e:
+                    yield numero, e
+    finally:
+        texto.detach()  # el archivo lo cierra quien lo abrió
+
+def _fila_error(numero: int, error: str) -> Dict[str, Any]:
+    return {"fila": numero, "estado": "error", "error": error}
+
+def _validar_fila(numero: int, datos: Any):
+    """
+    Devuelve la PersonaCreate de la fila o un resultado de error.
+    """
+    if isinstance(datos, Exception):
+        return _fila_error(numero, f"JSON inválido: {datos}")
+    if not isinstance(datos, dict):
+        return _fila_error(numero, "Se esperaba un objeto con los datos de la persona")
+    try:
+        persona = schemas.personaSchemas.PersonaCreate.model_validate({**datos, "fotografia": None})
+    except ValidationError as e:
+        return _fila_error(numero, "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()))
+    # Se revisan aquí para que una fila inválida no haga fallar el lote completo
+    for campo, enum in (("genero", models.personasModels.GeneroEnum),
+                        ("tipo_sangre", models.personasModels.TipoSangreEnum),
+                        ("estatus", models.personasModels.Estatus)):
+        if getattr(persona, campo) not in enum.__members__:
+            return _fila_error(numero, f"{campo}: debe ser uno de {', '.join(enum.__members__)}")
+    if not persona.contrasena:
+        return _fila_error(numero, "contrasena: no puede estar vacía")
+    return persona
+
+def _insertar_lote(db: Session, lote: List[Tuple[int, Any, str]], rol_id: int) -> List[Dict[str, Any]]:
+    """
+    Asigna nombres de usuario con una consulta para todo el lote e inserta
+    personas, usuarios y roles. Hace commit; una violación de unicidad sube como
+    IntegrityError para que el llamador reintente.
+    """
+    resultados = []
+    ocupados = _nombres_ocupados(
+        db, {_nombre_base(p.nombre, p.primer_apellido, p.segundo_apellido)[:6] for _, p, _ in lote}
+    )
+    pendientes = []
+    for numero, persona, contrasena in lote:
+        nombre_usuario = _primer_nombre_libre(
+            _nombre_base(persona.nombre, persona.primer_apellido, persona.segundo_apellido), ocupados
+        )
+        if nombre_usuario is None:
+            resultados.append(_fila_error(numero, "No se pudo generar un nombre de usuario único"))
+            continue
+        ocupados.add(_clave_nombre(nombre_usuario))
+        pendientes.append((numero, persona, contrasena, nombre_usuario))
+    if not pendientes:
+        return resultados
+
+    # Personas y usuarios con INSERT de varias filas por bloque; los ids se
+    # obtienen igual que en el alta masiva de transacciones (RETURNING o, en
+    # MySQL, los ids consecutivos a partir de LAST_INSERT_ID())
+    ahora = datetime.utcnow()
+    ids_personas = insertar_filas_con_ids(db, models.personasModels.Persona, [
+        {
+            "titulo_cortesia": persona.titulo_cortesia,
+            "nombre": persona.nombre,
+            "primer_apellido": persona.primer_apellido,
+            "segundo_apellido": persona.segundo_apellido,
+            "numero_telefonico": persona.numero_telefonico,
+            "fecha_nacimiento": persona.fecha_nacimiento,
+            "genero": persona.genero,
+            "tipo_sangre": persona.tipo_sangre,
+            "estatus": persona.estatus,
+        }
+        for _, persona, _, _ in pendientes
+    ])
+    ids_usuarios = insertar_filas_con_ids(db, models.usersModels.Usuario, [
+        {
+            "persona_id": persona_id,
+            "nombre_usuario": nombre_usuario,
+            "correo_electronico": persona.correo_electronico,
+            "contrasena": contrasena,
+            "estatus": persona.estatus,
+            "fecha_registro": ahora,
+        }
+        for persona_id, (_, persona, contrasena, nombre_usuario) in zip(ids_personas, pendientes)
+    ])
+    db.execute(insert(UsuarioRol), [
+        {"Usuario_ID": usuario_id, "Rol_ID": rol_id, "Estatus": True, "Fecha_Registro": ahora}
+        for usuario_id in ids_usuarios
+    ])
+    resultados.extend(
+        {"fila": numero, "estado": "creado", "nombre_usuario": nombre_usuario, "persona_id": persona_id}
+        for persona_id, (numero, _, _, nombre_usuario) in zip(ids_personas, pendientes)
+    )
+    db.commit()
+    return resultados
+
+def _importar_lote(db: Session, lote: List[Tuple[int, Any]], rol_id: int) -> List[Dict[str, Any]]:
+    resultados = []
+    correos = [persona.correo_electronico for _, persona in lote]
+    existentes = {
+        correo.lower() for (correo,) in db.query(models.usersModels.Usuario.correo_electronico).filter(
+            models.usersModels.Usuario.correo_electronico.in_(correos)
+        )
+    }
+    validos = []
+    for numero, persona in lote:
+        if persona.correo_electronico.lower() in existentes:
+            resultados.append(_fila_error(numero, "El correo electrónico ya está registrado"))
+        else:
+            validos.append((numero, persona))
+    if not validos:
+        return resultados
+
+    # El cifrado es lo más costoso: se reparte entre procesos, una sola vez por lote
+    contrasenas = hash_contrasenas_lote([persona.contrasena for _, persona in validos])
+    lote_cifrado = [(numero, persona, contrasena) for (numero, persona), contrasena in zip(validos, contrasenas)]
+
+    for intento in range(MAX_INTENTOS_NOMBRE_USUARIO):
+        try:
+            return resultados + _insertar_lote(db, lote_cifrado, rol_id)
+        except IntegrityError as e:
+            db.rollback()
+            # Igual que en create_persona: otro registro tomó un nombre asignado
+            if "nombre_usuario" in str(e.orig) and intento + 1 < MAX_INTENTOS_NOMBRE_USUARIO:
+                continue
+            return resultados + [_fila_error(numero, f"No se pudo guardar el lote: {e.orig}") for numero, _, _ in lote_cifrado]
+
+def importar_personas(db: Session, filas: Iterable[Tuple[int, Any]]) -> Dict[str, Any]:
+    """
+    Registra personas con su usuario y el rol "Cliente", por lotes de
+    TAMANO_LOTE_IMPORTACION. Cada lote se guarda por separado: una fila o un lote
+    con error no impide guardar los demás. Devuelve el resultado de cada fila.
+    """
+    inicio = time.perf_counter()
+    rol_cliente = db.query(Rol).filter(Rol.Nombre == "Cliente").first()
+    if not rol_cliente:
+        raise HTTPException(status_code=400, detail="Rol 'Cliente' no encontrado.")
+
+    resultados = []
+    correos_vistos = set()
+    lote = []
+    for numero, datos in filas:
+        persona = _validar_fila(numero, datos)
+        if isinstance(persona, dict):
+            resultados.append(persona)
+            continue
+        correo = persona.correo_electronico.lower()
+        if correo in correos_vistos:
+            resultados.append(_fila_error(numero, "Correo electrónico repetido en el archivo"))
+            continue
+        correos_vistos.add(correo)
+        lote.append((numero, persona))
+        if len(lote) >= TAMANO_LOTE_IMPORTACION:
+            resultados.extend(_importar_lote(db, lote, rol_cliente.ID))
+            lote = []
+    if lote:
+        resultados.extend(_importar_lote(db, lote, rol_cliente.ID))
+
+    resultados.sort(key=lambda r: r["fila"])
+    creados = sum(1 for r in resultados if r["estado"] == "creado")
+    return {
+        "total": len(resultados),
+        "creados": creados,
+        "errores": len(resultados) - creados,
+        "segundos": round(time.perf_counter() - inicio, 3),
+        "resultados": resultados,
+    }
@@ -0,0 +1,207 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import func, update, delete, insert
+from sqlalchemy.dialects import mysql, sqlite, postgresql
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from models.transaccionsModels import Transaccion, TipoTransaccion, MetodoPago, EstatusTransaccion
+from models.resumenesModels import ResumenTransacciones, GranularidadResumen
+from crud.estadisticasCrud import bloquear_estadisticas
+
+def inicio_periodo(fecha: datetime, granularidad: GranularidadResumen) -> datetime:
+    """
+    Devuelve la fecha de inicio del intervalo al que pertenece `fecha`.
+    """
+    if granularidad == GranularidadResumen.HORA:
+        return fecha.replace(minute=0, second=0, microsecond=0)
+    if granularidad == GranularidadResumen.DIA:
+        return fecha.replace(hour=0, minute=0, second=0, microsecond=0)
+    return fecha.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+def _acumular(
+    acumulado: Dict[tuple, List[float]],
+    fecha: datetime,
+    tipo_transaccion,
+    metodo_pago,
+    estatus,
+    monto: float,
+    cantidad: int
+) -> None:
+    for granularidad in GranularidadResumen:
+        clave = (
+            granularidad,
+            inicio_periodo(fecha, granularidad),
+            TipoTransaccion(tipo_transaccion),
+            MetodoPago(metodo_pago),
+            EstatusTransaccion(estatus),
+        )
+        valores = acumulado.setdefault(clave, [0.0, 0])
+        valores[0] += monto
+        valores[1] += cantidad
+
+def _filas(acumulado: Dict[tuple, List[float]]) -> List[dict]:
+    return [
+        {
+            "granularidad": granularidad,
+            "periodo": periodo,
+            "tipo_transaccion": tipo_transaccion,
+            "metodo_pago": metodo_pago,
+            "estatus": estatus,
+            "monto_total": monto_total,
+            "cantidad": cantidad,
+        }
+        for (granularidad, periodo, tipo_transaccion, metodo_pago, estatus), (monto_total, cantidad)
+        in acumulado.items()
+        if monto_total or cantidad
+    ]
+
+def _sumar_filas(db: Session, filas: List[dict]) -> None:
+    """
+    Suma los valores de `filas` a los intervalos existentes o los crea.
+
+    Cuando el motor soporta upsert se ejecuta una sola sentencia en modo
+    executemany: se compila una vez y el driver la envía como INSERT de varias filas.
+    """
+    tabla = ResumenTransacciones.__table__
+    dialecto = db.get_bind().dialect.name
+
+    if dialecto == "mysql":
+        sentencia = mysql.insert(tabla)
+        sentencia = sentencia.on_duplicate_key_update(
+            monto_total=tabla.c.monto_total + sentencia.inserted.monto_total,
+            cantidad=tabla.c.cantidad + sentencia.inserted.cantidad,
+        )
+        db.execute(sentencia, filas)
+        return
+
+    if dialecto in ("sqlite", "postgresql"):
+        modulo = sqlite if dialecto == "sqlite" else postgresql
+        sentencia = modulo.insert(tabla)
+        sentencia = sentencia.on_conflict_do_update(
+            index_elements=[columna.name for columna in tabla.primary_key.columns],
+            set_={
+                "monto_total": tabla.c.monto_total + sentencia.excluded.monto_total,
+                "cantidad": tabla.c.cantidad + sentencia.excluded.cantidad,
+            },
+        )
+        db.execute(sentencia, filas)
+        return
+
+    # Otros motores: actualizar y, si el intervalo no existía, insertarlo
+    for fila in filas:
+        resultado = db.execute(
+            update(ResumenTransacciones)
+            .where(
+                ResumenTransacciones.granularidad == fila["granularidad"],
+                ResumenTransacciones.periodo == fila["periodo"],
+                ResumenTransacciones.tipo_transaccion == fila["tipo_transaccion"],
+                ResumenTransacciones.metodo_pago == fila["metodo_pago"],
+                ResumenTransacciones.estatus == fila["estatus"],
+            )
+            .values(
+                monto_total=ResumenTransacciones.monto_total + fila["monto_total"],
+                cantidad=ResumenTransacciones.cantidad + fila["cantidad"],
+            )
+        )
+        if resultado.rowcount == 0:
+            db.execute(insert(tabla).values(fila))
+
+def aplicar_cambios_resumen(db: Session, cambios: Iterable) -> None:
+    """
+    Ajusta los resúmenes por hora, día y mes sin hacer commit.
+    Recibe objetos CambioTransaccion (ver crud.agregadosCrud).
+    """
+    acumulado: Dict[tuple, List[float]] = {}
+    for cambio in cambios:
+        _acumular(
+            acumulado,
+            cambio.fecha_registro,
+            cambio.tipo_transaccion,
+            cambio.metodo_pago,
+            cambio.estatus,
+            cambio.signo * cambio.monto,
+            cambio.signo,
+        )
+
+    filas = _filas(acumulado)
+    if filas:
+        _sumar_filas(db, filas)
+
+def _expresion_hora(dialecto: str):
+    fecha = Transaccion.fecha_registro
+    if dialecto == "mysql":
+        return func.date_format(fecha, "%Y-%m-%d %H:00:00")
+    if dialecto == "postgresql":
+        return func.date_trunc("hour", fecha)
+    return func.strftime("%Y-%m-%d %H:00:00", fecha)
+
+def reconstruir_resumenes(db: Session, commit: bool = True) -> int:
+    """
+    Vuelve a generar todos los resúmenes a partir de la tabla de transacciones.
+
+    La agrupación por hora la hace la base de datos; los días y meses se obtienen
+    sumando esas horas. Devuelve el número de intervalos generados.
+
+    Toma el mismo bloqueo que reconstruir_estadisticas: las altas lo piden antes
+    de sumar sus resúmenes, así que no se cruzan con el borrado y la inserción.
+    """
+    bloquear_estadisticas(db)
+    hora = _expresion_hora(db.get_bind().dialect.name).label("hora")
+    consulta = db.query(
+        hora,
+        Transaccion.tipo_transaccion,
+        Transaccion.metodo_pago,
+        Transaccion.estatus,
+        func.sum(Transaccion.monto),
+        func.count(Transaccion.id),
+    ).group_by(hora, Transaccion.tipo_transaccion, Transaccion.metodo_pago, Transaccion.estatus)
+
+    acumulado: Dict[tuple, List[float]] = {}
+    for periodo, tipo_transaccion, metodo_pago, estatus, monto_total, cantidad in consulta:
+        if isinstance(periodo, str):
+            periodo = datetime.strptime(periodo, "%Y-%m-%d %H:%M:%S")
+        _acumular(acumulado, periodo, tipo_transaccion, metodo_pago, estatus, float(monto_total or 0), int(cantidad))
+
+    db.execute(delete(ResumenTransacciones))
+    filas = _filas(acumulado)
+    # Insertar por bloques para no armar sentencias demasiado grandes
+    for inicio in range(0, len(filas), 1000):
+        db.execute(insert(ResumenTransacciones.__table__), filas[inicio:inicio + 1000])
+
+    if commit:
+        db.commit()
+    else:
+        db.flush()
+    return len(filas)
+
+def obtener_series(
+    db: Session,
+    granularidad: GranularidadResumen,
+    fecha_inicio: Optional[datetime] = None,
+    fecha_fin: Optional[datetime] = None,
+    tipo_transaccion: Optional[TipoTransaccion] = None,
+    metodo_pago: Optional[MetodoPago] = None,
+    estatus: Optional[EstatusTransaccion] = None
+) -> List[ResumenTransacciones]:
+    """
+    Obtiene los intervalos del rango pedido; el costo depende del número de
+    intervalos y no del número de transacciones.
+    """
+    query = db.query(ResumenTransacciones).filter(ResumenTransacciones.granularidad == granularidad)
+
+    if fecha_inicio:
+        query = query.filter(ResumenTransacciones.periodo >= inicio_periodo(fecha_inicio, granularidad))
+    if fecha_fin:
+        query = query.filter(ResumenTransacciones.periodo <= fecha_fin)
+    if tipo_transaccion:
+        query = query.filter(ResumenTransacciones.tipo_transaccion == tipo_transaccion)
+    if metodo_pago:
+        query = query.filter(ResumenTransacciones.metodo_pago == metodo_pago)
+    if estatus:
+        query = query.filter(ResumenTransacciones.estatus == estatus)
+
+    return query.filter(ResumenTransacciones.cantidad != 0).order_by(
+        ResumenTransacciones.periodo,
+        ResumenTransacciones.tipo_transaccion,
+        ResumenTransacciones.metodo_pago,
+        ResumenTransacciones.estatus
+    ).all()
@@ -0,0 +1,38 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import delete, insert
+from typing import List, Optional
+import time
+from models.revocacionesModels import RevocacionToken
+
+def registrar_revocacion(
+    conexion, revocado_en: float, expira: float, jti: Optional[str] = None, usuario_id: Optional[int] = None
+) -> None:
+    """
+    Inserta la revocación en la transacción abierta de `conexion` (Session o
+    Connection), sin hacer commit: se guarda junto con el cambio que la origina.
+    """
+    conexion.execute(insert(RevocacionToken.__table__).values(
+        jti=jti, usuario_id=usuario_id, revocado_en=revocado_en, expira=expira
+    ))
+
+def obtener_revocaciones_desde(db: Session, desde: Optional[float] = None) -> List[RevocacionToken]:
+    """
+    Revocaciones vigentes registradas desde `desde` (segundos epoch); todas las
+    vigentes si es None.
+
+    Se filtra por momento y no por id: una revocación se confirma después de
+    registrarse, así que quien consulta pide desde un poco antes de su última
+    consulta y vuelve a aplicar algunas (aplicarlas dos veces no cambia nada).
+    """
+    consulta = db.query(RevocacionToken).filter(RevocacionToken.expira > time.time())
+    if desde is not None:
+        consulta = consulta.filter(RevocacionToken.revocado_en >= desde)
+    return consulta.order_by(RevocacionToken.id).all()
+
+def compactar_revocaciones(db: Session) -> int:
+    """
+    Borra las revocaciones de tokens que ya expiraron. Devuelve cuántas se borraron.
+    """
+    resultado = db.execute(delete(RevocacionToken).where(RevocacionToken.expira <= time.time()))
+    db.commit()
+    return resultado.rowcount
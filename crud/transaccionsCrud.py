@@ -1,13 +1,33 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, and_, or_, insert, case
 from datetime import datetime
+from enum import Enum
+import base64
+import csv
+import io
+import json
 from models.transaccionsModels import Transaccion, TipoTransaccion, MetodoPago, EstatusTransaccion
 from schemas.transaccionSchemas import TransaccionCreate, TransaccionUpdate
 from fastapi import HTTPException, status
-from typing import List, Optional
+from typing import Dict, Iterator, List, Optional, Tuple
 from models.rolesModels import Rol  # Importa el modelo Rol
 from models.usuarioRolesModels import UsuarioRol  # Importa el modelo UsuarioRol
 from models.usersModels import Usuario
+from crud.agregadosCrud import aplicar_cambios, cambio_desde_transaccion, CambioTransaccion
+from crud.eventosCrud import registrar_evento, descartar_eventos
+from config.cache import CacheTTL
+
+# usuario_id -> (nombre_usuario, rol); evita consultar usuario y rol en cada alta.
+# Se invalida desde los hooks de sesión de config.jwt al cambiar el usuario o sus roles
+cache_datos_usuarios = CacheTTL(max_elementos=4096, ttl_segundos=300)
+
+# usuario_id -> (total_ingresos, total_egresos); se invalida al escribir transacciones
+# del usuario, solo en este proceso: en los demás workers dura hasta el TTL
+cache_balances = CacheTTL(max_elementos=10000, ttl_segundos=300)
+
+# nombre del rol -> ids de los usuarios activos con ese rol
+cache_usuarios_por_rol = CacheTTL(max_elementos=64, ttl_segundos=60)
 
 def obtener_usuarios_por_transaccion(db: Session, tipo_transaccion: str, rol: str):
     resultados = (
@@ -35,25 +55,226 @@ def obtener_usuarios_por_transaccion(db: Session, tipo_transaccion: str, rol: st
 # CREATE
 def crear_transaccion(db: Session, transaccion_data: dict) -> Transaccion:
     try:
+        estatus = transaccion_data.get("estatus") or EstatusTransaccion.PROCESANDO
         db_transaccion = Transaccion(
             usuario_id=transaccion_data["usuario_id"],
             detalles=transaccion_data["detalles"],
             tipo_transaccion=transaccion_data["tipo_transaccion"],
             metodo_pago=transaccion_data["metodo_pago"],
             monto=transaccion_data["monto"],
-            estatus=transaccion_data.get("estatus", EstatusTransaccion.PROCESANDO)
+            estatus=estatus,
+            # Se asignan aquí (y no con el default del servidor) para tener la
+            # fila completa sin volver a leerla después del INSERT. Sin
+            # microsegundos: la columna es DATETIME y MySQL los redondearía,
+            # y la respuesta y el evento no coincidirían con lo guardado
+            fecha_registro=datetime.now().replace(microsecond=0),
+            fecha_actualizacion=None
         )
         db.add(db_transaccion)
+        db.flush()
+
+        # Los agregados y el evento se guardan en la misma transacción que el alta
+        aplicar_cambios(db, [cambio_desde_transaccion(db_transaccion)])
+        registrar_evento(db, "transaccion_creada", transaccion=fila_transaccion(db, db_transaccion))
+
         db.commit()
-        db.refresh(db_transaccion)
+        invalidar_balance(db_transaccion.usuario_id)
         return db_transaccion
     except Exception as e:
         db.rollback()
+        descartar_eventos(db)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error al crear transacción: {str(e)}"
         )
 
+def fila_transaccion(db: Session, transaccion: Transaccion) -> dict:
+    """
+    Datos de la transacción como en TransaccionResponse, con nombre de usuario y rol.
+    """
+    nombre_usuario, rol = obtener_datos_usuario(db, transaccion.usuario_id) or (None, None)
+    return {
+        "id": transaccion.id,
+        "detalles": transaccion.detalles,
+        "tipo_transaccion": transaccion.tipo_transaccion,
+        "metodo_pago": transaccion.metodo_pago,
+        "monto": transaccion.monto,
+        "estatus": transaccion.estatus,
+        "usuario_id": transaccion.usuario_id,
+        "fecha_registro": transaccion.fecha_registro,
+        "fecha_actualizacion": transaccion.fecha_actualizacion,
+        "nombre_usuario": nombre_usuario,
+        "rol": rol,
+    }
+
+def obtener_datos_usuarios(db: Session, usuario_ids) -> Dict[int, Tuple[str, str]]:
+    """
+    Obtiene (nombre_usuario, rol) de varios usuarios: primero de la caché y los
+    que falten con una sola consulta.
+    """
+    datos: Dict[int, Tuple[str, str]] = {}
+    faltantes = set()
+    for usuario_id in set(usuario_ids):
+        en_cache = cache_datos_usuarios.obtener(usuario_id)
+        if en_cache is None:
+            faltantes.add(usuario_id)
+        else:
+            datos[usuario_id] = en_cache
+    if not faltantes:
+        return datos
+
+    generacion = cache_datos_usuarios.generacion()
+    resultados = (
+        db.query(Usuario.id, Usuario.nombre_usuario, Rol.Nombre)
+        .join(UsuarioRol, Usuario.id == UsuarioRol.Usuario_ID)
+        .join(Rol, UsuarioRol.Rol_ID == Rol.ID)
+        .filter(Usuario.id.in_(faltantes))
+        .order_by(Usuario.id, UsuarioRol.Rol_ID)
+        .all()
+    )
+    for usuario_id, nombre_usuario, rol in resultados:
+        if usuario_id not in datos:
+            datos[usuario_id] = (nombre_usuario, rol)
+            cache_datos_usuarios.guardar(usuario_id, datos[usuario_id], generacion=generacion)
+    return datos
+
+def obtener_datos_usuario(db: Session, usuario_id: int) -> Optional[Tuple[str, str]]:
+    """
+    Obtiene (nombre_usuario, rol) de un usuario; None si no existe.
+    """
+    return obtener_datos_usuarios(db, [usuario_id]).get(usuario_id)
+
+def invalidar_datos_usuario(usuario_id: int) -> None:
+    cache_datos_usuarios.invalidar(usuario_id)
+
+def insertar_filas_con_ids(db: Session, modelo, filas: List[dict], tamano_bloque: int = 500) -> List[int]:
+    """
+    Inserta las filas de `modelo` con sentencias INSERT de varias filas y
+    devuelve sus ids (llave primaria autoincremental `id`) en orden.
+    """
+    dialecto = db.get_bind().dialect
+    ids: List[int] = []
+
+    if dialecto.insert_executemany_returning_sort_by_parameter_order:
+        resultado = db.execute(
+            insert(modelo).returning(modelo.id, sort_by_parameter_order=True),
+            filas
+        )
+        return list(resultado.scalars())
+
+    if dialecto.name == "mysql":
+        # En MySQL un INSERT de varias filas con número conocido de filas recibe ids
+        # consecutivos y LAST_INSERT_ID() devuelve el primero de ellos.
+        for inicio in range(0, len(filas), tamano_bloque):
+            bloque = filas[inicio:inicio + tamano_bloque]
+            resultado = db.execute(insert(modelo).values(bloque))
+            primero = resultado.lastrowid
+            ids.extend(range(primero, primero + len(bloque)))
+        return ids
+
+    objetos = [modelo(**fila) for fila in filas]
+    db.add_all(objetos)
+    db.flush()
+    return [objeto.id for objeto in objetos]
+
+def crear_transacciones_lote(db: Session, transacciones: List[dict]) -> List[dict]:
+    """
+    Registra varias transacciones en una sola transacción de base de datos.
+
+    Se valida todo el lote antes de insertar: si algún usuario no existe no se
+    guarda ninguna. Devuelve los datos de cada transacción con nombre de usuario y rol.
+    """
+    datos_usuarios = obtener_datos_usuarios(db, [t["usuario_id"] for t in transacciones])
+    faltantes = sorted({t["usuario_id"] for t in transacciones} - set(datos_usuarios))
+    if faltantes:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Usuarios no encontrados: {faltantes}"
+        )
+
+    fecha_registro = datetime.now().replace(microsecond=0)
+    filas = [
+        {
+            "usuario_id": t["usuario_id"],
+            "detalles": t["detalles"],
+            "tipo_transaccion": TipoTransaccion(t["tipo_transaccion"]),
+            "metodo_pago": MetodoPago(t["metodo_pago"]),
+            "monto": t["monto"],
+            "estatus": EstatusTransaccion(t.get("estatus") or EstatusTransaccion.PROCESANDO),
+            "fecha_registro": fecha_registro,
+            "fecha_actualizacion": None,
+        }
+        for t in transacciones
+    ]
+
+    try:
+        ids = insertar_filas_con_ids(db, Transaccion, filas)
+        respuesta = []
+        for transaccion_id, fila in zip(ids, filas):
+            nombre_usuario, rol = datos_usuarios[fila["usuario_id"]]
+            respuesta.append({
+                **fila,
+                "id": transaccion_id,
+                "nombre_usuario": nombre_usuario,
+                "rol": rol,
+            })
+
+        aplicar_cambios(db, [
+            CambioTransaccion(
+                fecha_registro=fila["fecha_registro"],
+                tipo_transaccion=fila["tipo_transaccion"],
+                metodo_pago=fila["metodo_pago"],
+                estatus=fila["estatus"],
+                monto=fila["monto"]
+            )
+            for fila in filas
+        ])
+        registrar_evento(db, "transacciones_creadas", transacciones=respuesta)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        descartar_eventos(db)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error al crear transacciones: {str(e)}"
+        )
+
+    for usuario_id in datos_usuarios:
+        invalidar_balance(usuario_id)
+    return respuesta
+
+# UPDATE
+def actualizar_transaccion(db: Session, transaccion_id: int, transaccion_data: TransaccionUpdate) -> Optional[Transaccion]:
+    """
+    Actualiza una transacción (por ejemplo su estatus) y ajusta los totales acumulados.
+    """
+    db_transaccion = db.query(Transaccion).filter(Transaccion.id == transaccion_id).first()
+    if db_transaccion is None:
+        return None
+
+    try:
+        anterior = cambio_desde_transaccion(db_transaccion, signo=-1)
+
+        update_data = transaccion_data.model_dump(exclude_unset=True, exclude_none=True)
+        for field, value in update_data.items():
+            setattr(db_transaccion, field, value)
+        db_transaccion.fecha_actualizacion = datetime.now().replace(microsecond=0)
+        db.flush()
+
+        aplicar_cambios(db, [anterior, cambio_desde_transaccion(db_transaccion)])
+        registrar_evento(db, "transaccion_actualizada", transaccion=fila_transaccion(db, db_transaccion))
+
+        db.commit()
+        invalidar_balance(db_transaccion.usuario_id)
+        return db_transaccion
+    except Exception as e:
+        db.rollback()
+        descartar_eventos(db)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error al actualizar transacción: {str(e)}"
+        )
+
 # READ
 def obtener_transaccion(db: Session, transaccion_id: int) -> Optional[Transaccion]:
     """
@@ -61,6 +282,103 @@ def obtener_transaccion(db: Session, transaccion_id: int) -> Optional[Transaccio
     """
     return db.query(Transaccion).filter(Transaccion.id == transaccion_id).first()
 
+def codificar_cursor(fecha_registro: datetime, transaccion_id: int) -> str:
+    """
+    Genera un cursor opaco a partir de la última fila de una página.
+    """
+    contenido = json.dumps({"f": fecha_registro.isoformat(), "id": transaccion_id})
+    return base64.urlsafe_b64encode(contenido.encode("utf-8")).decode("ascii")
+
+def decodificar_cursor(cursor: str) -> tuple:
+    """
+    Obtiene la pareja (fecha_registro, id) contenida en un cursor.
+    """
+    try:
+        contenido = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.fromisoformat(contenido["f"]), int(contenido["id"])
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cursor de paginación no válido"
+        )
+
+def consultar_transacciones(
+    db: Session,
+    tipo_transaccion: Optional[TipoTransaccion] = None,
+    metodo_pago: Optional[MetodoPago] = None,
+    estatus: Optional[EstatusTransaccion] = None,
+    usuario_id: Optional[int] = None,
+    fecha_inicio: Optional[datetime] = None,
+    fecha_fin: Optional[datetime] = None
+):
+    """
+    Construye la consulta de transacciones (con usuario y rol) aplicando los filtros.
+    """
+    # Ajustar la consulta para incluir todos los campos necesarios
+    query = db.query(
+        Transaccion.id,
+        Transaccion.detalles,
+        Transaccion.tipo_transaccion,
+        Transaccion.metodo_pago,
+        Transaccion.monto,
+        Transaccion.estatus,
+        Transaccion.usuario_id,
+        Transaccion.fecha_registro,
+        Transaccion.fecha_actualizacion,
+        Usuario.nombre_usuario.label("nombre_usuario"),
+        Usuario.estatus.label("estatus_usuario"),
+        Rol.Nombre.label("rol")  # Incluye el nombre del rol desde la tabla Rol
+    ).join(Usuario, Transaccion.usuario_id == Usuario.id
+    ).join(UsuarioRol, Usuario.id == UsuarioRol.Usuario_ID
+    ).join(Rol, UsuarioRol.Rol_ID == Rol.ID)  # Join con la tabla Rol
+
+    # Aplicar filtros
+    if tipo_transaccion:
+        query = query.filter(Transaccion.tipo_transaccion == tipo_transaccion)
+    if metodo_pago:
+        query = query.filter(Transaccion.metodo_pago == metodo_pago)
+    if estatus:
+        query = query.filter(Transaccion.estatus == estatus)
+    if usuario_id:      
+        query = query.filter(Transaccion.usuario_id == usuario_id)
+    if fecha_inicio:
+        query = query.filter(Transaccion.fecha_registro >= fecha_inicio)
+    if fecha_fin:
+        query = query.filter(Transaccion.fecha_registro <= fecha_fin)
+    return query
+
+def consulta_paginada_transacciones(
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    **filtros
+):
+    """
+    Construye la consulta de una página de transacciones, ordenada por
+    (fecha_registro, id) descendente.
+
+    Si se recibe un cursor se pagina por (fecha_registro, id) en lugar de usar
+    offset, de modo que una página profunda cuesta lo mismo que la primera.
+    """
+    posicion = decodificar_cursor(cursor) if cursor else None
+    query = consultar_transacciones(db, **filtros)
+
+    # Continuar justo después de la última fila de la página anterior. La
+    # condición fecha_registro <= cursor permite recorrer el índice por rango.
+    if posicion:
+        fecha_cursor, id_cursor = posicion
+        query = query.filter(
+            Transaccion.fecha_registro <= fecha_cursor,
+            or_(Transaccion.fecha_registro < fecha_cursor, Transaccion.id < id_cursor)
+        )
+
+    # Ordenar y paginar (el id desempata registros con la misma fecha)
+    query = query.order_by(Transaccion.fecha_registro.desc(), Transaccion.id.desc())
+    if not posicion:
+        query = query.offset(skip)
+    return query.limit(limit)
+
 def obtener_todas_transacciones(
     db: Session,
     skip: int = 0,
@@ -69,53 +387,84 @@ def obtener_todas_transacciones(
     estatus: Optional[EstatusTransaccion] = None,
     usuario_id: Optional[int] = None,
     fecha_inicio: Optional[datetime] = None,
-    fecha_fin: Optional[datetime] = None
+    fecha_fin: Optional[datetime] = None,
+    limit: int = 100,
+    cursor: Optional[str] = None
 ) -> List[Transaccion]:
     """
     Obtiene todas las transacciones con filtros opcionales y paginación.
     """
+    query = consulta_paginada_transacciones(
+        db,
+        skip=skip,
+        limit=limit,
+        cursor=cursor,
+        tipo_transaccion=tipo_transaccion,
+        metodo_pago=metodo_pago,
+        estatus=estatus,
+        usuario_id=usuario_id,
+        fecha_inicio=fecha_inicio,
+        fecha_fin=fecha_fin
+    )
     try:
-        # Ajustar la consulta para incluir todos los campos necesarios
-        query = db.query(
-            Transaccion.id,
-            Transaccion.detalles,
-            Transaccion.tipo_transaccion,
-            Transaccion.metodo_pago,
-            Transaccion.monto,
-            Transaccion.estatus,
-            Transaccion.usuario_id,
-            Transaccion.fecha_registro,
-            Transaccion.fecha_actualizacion,
-            Usuario.nombre_usuario.label("nombre_usuario"),
-            Usuario.estatus.label("estatus_usuario"),
-            Rol.Nombre.label("rol")  # Incluye el nombre del rol desde la tabla Rol
-        ).join(Usuario, Transaccion.usuario_id == Usuario.id
-        ).join(UsuarioRol, Usuario.id == UsuarioRol.Usuario_ID
-        ).join(Rol, UsuarioRol.Rol_ID == Rol.ID)  # Join con la tabla Rol
-
-        # Aplicar filtros
-        if tipo_transaccion:
-            query = query.filter(Transaccion.tipo_transaccion == tipo_transaccion)
-        if metodo_pago:
-            query = query.filter(Transaccion.metodo_pago == metodo_pago)
-        if estatus:
-            query = query.filter(Transaccion.estatus == estatus)
-        if usuario_id:      
-            query = query.filter(Transaccion.usuario_id == usuario_id)
-        if fecha_inicio:
-            query = query.filter(Transaccion.fecha_registro >= fecha_inicio)
-        if fecha_fin:
-            query = query.filter(Transaccion.fecha_registro <= fecha_fin)
-
-        # Ordenar y paginar
-        result = query.order_by(Transaccion.fecha_registro.desc()).offset(skip).all()
-        return result
+        return query.all()
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error al obtener transacciones: {str(e)}"
         )
 
+COLUMNAS_EXPORTACION = [
+    "id", "detalles", "tipo_transaccion", "metodo_pago", "monto", "estatus", "usuario_id",
+    "fecha_registro", "fecha_actualizacion", "nombre_usuario", "estatus_usuario", "rol"
+]
+
+def _valor_exportable(valor):
+    if isinstance(valor, Enum):
+        return valor.value
+    if isinstance(valor, datetime):
+        return valor.isoformat()
+    return valor
+
+def exportar_transacciones(
+    db: Session,
+    formato: str = "ndjson",
+    tamano_lote: int = 1000,
+    **filtros
+) -> Iterator[str]:
+    """
+    Genera las transacciones filtradas como NDJSON o CSV, en bloques de texto.
+
+    Las filas se leen con un cursor del lado del servidor (yield_per), así que la
+    memoria usada no depende del número de transacciones exportadas.
+    """
+    query = consultar_transacciones(db, **filtros).order_by(
+        Transaccion.fecha_registro.desc(), Transaccion.id.desc()
+    ).yield_per(tamano_lote)
+
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer) if formato == "csv" else None
+    if escritor:
+        escritor.writerow(COLUMNAS_EXPORTACION)
+
+    pendientes = 0
+    for fila in query:
+        valores = [_valor_exportable(getattr(fila, columna)) for columna in COLUMNAS_EXPORTACION]
+        if escritor:
+            escritor.writerow(valores)
+        else:
+            buffer.write(json.dumps(dict(zip(COLUMNAS_EXPORTACION, valores)), ensure_ascii=False))
+            buffer.write("\n")
+        pendientes += 1
+        if pendientes >= tamano_lote:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pendientes = 0
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
 def obtener_usuarios_por_rol(db: Session, tipo_transaccion: TipoTransaccion, rol: str):
     """
     Obtiene usuarios de acuerdo al tipo de transacción y el rol.
@@ -160,6 +509,115 @@ def obtener_balance(db: Session, usuario_id: int) -> float:
     """
     Calcula el balance general de un usuario.
     """
-    ingresos = obtener_total_ingresos(db, usuario_id)
-    egresos = obtener_total_egresos(db, usuario_id)
-    return ingresos - egresos
\ No newline at end of file
+    return obtener_balances(db, usuario_ids=[usuario_id])[0]["balance"]
+
+def invalidar_balance(usuario_id: int) -> None:
+    cache_balances.invalidar(usuario_id)
+
+def _usuarios_con_rol(db: Session, rol: str) -> List[int]:
+    usuario_ids = cache_usuarios_por_rol.obtener(rol)
+    if usuario_ids is None:
+        usuario_ids = [
+            r.Usuario_ID for r in db.query(UsuarioRol.Usuario_ID)
+            .join(Rol, UsuarioRol.Rol_ID == Rol.ID)
+            .filter(Rol.Nombre == rol, UsuarioRol.Estatus == True)
+            .order_by(UsuarioRol.Usuario_ID)
+            .distinct()
+        ]
+        cache_usuarios_por_rol.guardar(rol, usuario_ids)
+    return usuario_ids
+
+def obtener_balances(
+    db: Session,
+    usuario_ids: Optional[List[int]] = None,
+    rol: Optional[str] = None,
+    limite: Optional[int] = None
+) -> List[dict]:
+    """
+    Obtiene ingresos, egresos y balance de varios usuarios (por lista de ids o por rol).
+
+    Los usuarios que no están en caché se calculan juntos con una sola consulta
+    GROUP BY con sumas condicionales, en lugar de dos SUM por usuario. Con `limite`,
+    se rechaza la consulta si resuelve más usuarios (también los de un rol).
+
+    La caché se invalida al confirmar cada escritura, pero solo en este proceso;
+    en otros workers un balance puede tener hasta el TTL de cache_balances de atraso.
+    """
+    if usuario_ids is None:
+        usuario_ids = _usuarios_con_rol(db, rol) if rol else []
+    usuario_ids = list(dict.fromkeys(usuario_ids))
+    if limite is not None and len(usuario_ids) > limite:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"No se pueden consultar más de {limite} usuarios a la vez"
+        )
+
+    # Se toma antes de consultar: si una escritura invalida a un usuario mientras
+    # tanto, su total calculado aquí se devuelve pero no se guarda
+    generacion = cache_balances.generacion()
+    totales: Dict[int, Tuple[float, float]] = {}
+    faltantes = []
+    for usuario_id in usuario_ids:
+        en_cache = cache_balances.obtener(usuario_id)
+        if en_cache is None:
+            faltantes.append(usuario_id)
+        else:
+            totales[usuario_id] = en_cache
+
+    if faltantes:
+        pagada = Transaccion.estatus == EstatusTransaccion.PAGADA
+        resultados = db.query(
+            Transaccion.usuario_id,
+            func.sum(case(
+                (pagada & (Transaccion.tipo_transaccion == TipoTransaccion.INGRESO), Transaccion.monto),
+                else_=0
+            )),
+            func.sum(case(
+                (pagada & (Transaccion.tipo_transaccion == TipoTransaccion.EGRESO), Transaccion.monto),
+                else_=0
+            ))
+        ).filter(Transaccion.usuario_id.in_(faltantes)).group_by(Transaccion.usuario_id).all()
+
+        calculados = {r[0]: (float(r[1] or 0), float(r[2] or 0)) for r in resultados}
+        for usuario_id in faltantes:
+            totales[usuario_id] = calculados.get(usuario_id, (0.0, 0.0))
+            cache_balances.guardar(usuario_id, totales[usuario_id], generacion=generacion)
+
+    return [
+        {
+            "usuario_id": usuario_id,
+            "total_ingresos": totales[usuario_id][0],
+            "total_egresos": totales[usuario_id][1],
+            "balance": totales[usuario_id][0] - totales[usuario_id][1],
+        }
+        for usuario_id in usuario_ids
+    ]
+
+
+# --- Versiones asíncronas (AsyncSession) para las rutas async def ---
+# Las escrituras ajustan totales y resúmenes con varias sentencias; se reutiliza
+# la misma lógica síncrona con run_sync, que la ejecuta sobre la conexión
+# asíncrona sin bloquear el event loop.
+
+async def obtener_datos_usuario_async(db: AsyncSession, usuario_id: int) -> Optional[Tuple[str, str]]:
+    en_cache = cache_datos_usuarios.obtener(usuario_id)
+    if en_cache is not None:
+        return en_cache
+    return await db.run_sync(obtener_datos_usuario, usuario_id)
+
+async def obtener_datos_usuarios_async(db: AsyncSession, usuario_ids) -> Dict[int, Tuple[str, str]]:
+    return await db.run_sync(obtener_datos_usuarios, usuario_ids)
+
+async def crear_transaccion_async(db: AsyncSession, transaccion_data: dict) -> Transaccion:
+    return await db.run_sync(crear_transaccion, transaccion_data)
+
+async def crear_transacciones_lote_async(db: AsyncSession, transacciones: List[dict]) -> List[dict]:
+    return await db.run_sync(crear_transacciones_lote, transacciones)
+
+async def actualizar_transaccion_async(
+    db: AsyncSession, transaccion_id: int, transaccion_data: TransaccionUpdate
+) -> Optional[Transaccion]:
+    return await db.run_sync(actualizar_transaccion, transaccion_id, transaccion_data)
+
+async def obtener_transaccion_async(db: AsyncSession, transaccion_id: int) -> Optional[Transaccion]:
+    return await db.get(Transaccion, transaccion_id)
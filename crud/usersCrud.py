@@ -1,7 +1,12 @@
-from typing import Optional  # Importar Optional
+from typing import List, Optional  # Importar Optional
 from passlib.context import CryptContext
 from sqlalchemy.orm import Session  # Importar Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from config.hashing import hash_contrasena, verificar_contrasena
 import models.usersModels
+import models.usuarioRolesModels
+import models.rolesModels
 import schemas.userSchemas
 
 
@@ -68,4 +73,61 @@ def get_usuarios_gerentes(db: Session):
         .join(models.rolesModels.Rol, models.usuarioRolesModels.UsuarioRol.Rol_ID == models.rolesModels.Rol.ID)
         .filter(models.rolesModels.Rol.Nombre == "Gerente", models.usuarioRolesModels.UsuarioRol.Estatus == True)
         .all()
-    )
\ No newline at end of file
+    )
+
+
+# --- Versiones asíncronas (AsyncSession) para las rutas async def ---
+# bcrypt es costoso en CPU, por eso el hash y la verificación se ejecutan en el
+# pool dedicado de config.hashing (responde 503 si está saturado).
+
+async def get_user_by_nombre_usuario_async(db: AsyncSession, nombre_usuario: str):
+    resultado = await db.execute(
+        select(models.usersModels.Usuario).where(models.usersModels.Usuario.nombre_usuario == nombre_usuario).limit(1)
+    )
+    return resultado.scalars().first()
+
+async def get_user_async(db: AsyncSession, id: int):
+    return await db.get(models.usersModels.Usuario, id)
+
+async def get_user_by_nombre_usuario_or_email_async(db: AsyncSession, nombre_usuario: Optional[str] = None, correo_electronico: Optional[str] = None):
+    query = select(models.usersModels.Usuario)
+
+    if nombre_usuario:
+        query = query.where(models.usersModels.Usuario.nombre_usuario == nombre_usuario)
+    if correo_electronico:
+        query = query.where(models.usersModels.Usuario.correo_electronico == correo_electronico)
+
+    resultado = await db.execute(query.limit(1))
+    return resultado.scalars().first()
+
+async def authenticate_user_async(db: AsyncSession, nombre_usuario: str, contrasena: str):
+    usuario = await get_user_by_nombre_usuario_async(db, nombre_usuario)
+
+    if not usuario or not await verificar_contrasena(contrasena, usuario.contrasena):
+        return None
+    return usuario
+
+async def get_roles_usuario_async(db: AsyncSession, usuario_id: int) -> List[str]:
+    """
+    Nombres de los roles activos del usuario, para incluirlos en el token.
+    """
+    resultado = await db.execute(
+        select(models.rolesModels.Rol.Nombre)
+        .join(models.usuarioRolesModels.UsuarioRol, models.usuarioRolesModels.UsuarioRol.Rol_ID == models.rolesModels.Rol.ID)
+        .where(models.usuarioRolesModels.UsuarioRol.Usuario_ID == usuario_id, models.usuarioRolesModels.UsuarioRol.Estatus == True)
+        .order_by(models.rolesModels.Rol.ID)
+    )
+    return list(resultado.scalars().all())
+
+async def create_user_async(db: AsyncSession, user: schemas.userSchemas.UsuarioCreate):
+    hashed_contrasena = await hash_contrasena(user.contrasena)
+    db_user = models.usersModels.Usuario(
+        nombre_usuario=user.nombre_usuario,
+        correo_electronico=user.correo_electronico,
+        contrasena=hashed_contrasena,
+        estatus=user.estatus,
+    )
+    db.add(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+    return db_user
@@ -1,3 +1,5 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from config.db import engine, Base
@@ -6,6 +8,10 @@ from routes.personaRoutes import persona
 from routes.transaccionRoutes import transaccion
 from routes.sucursalRoutes import sucursal
 from models.bitacoraModels import Bitacora
+from webSocket.websocket import manager
+from crud.eventosCrud import compactar_periodicamente
+from config.hashing import cerrar_pool_procesos
+from config.jwt import sincronizar_revocaciones_periodicamente
 
 # Importar los seeders para registrar los eventos after_create
 from seeders.personaSeeder import seed_personas
@@ -13,10 +19,29 @@ from seeders.usuarioSeeder import seed_usuarios
 from seeders.eventlisten import seed_roles
 from seeders.usuariosRoles import seed_usuarios_roles
 from seeders.sucursalesSeeder import sucursales_iniciales
+from seeders.estadisticasSeeder import seed_estadisticas
+
+# 🔹 Inicia y detiene el bus de mensajes del websocket (compartido entre workers),
+# la compactación periódica de la bandeja de eventos y la copia de las
+# revocaciones de tokens; al final cierra el pool de procesos de las
+# importaciones masivas
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await manager.iniciar()
+    compactacion = asyncio.create_task(compactar_periodicamente())
+    revocaciones = asyncio.create_task(sincronizar_revocaciones_periodicamente())
+    try:
+        yield
+    finally:
+        compactacion.cancel()
+        revocaciones.cancel()
+        await manager.detener()
+        cerrar_pool_procesos()
 
 app = FastAPI(
     title="Modulo Gerencia Gimnasio Bulls",
-    description="Api hecha para el modulo de gerencia para el gimnasio Bulls"
+    description="Api hecha para el modulo de gerencia para el gimnasio Bulls",
+    lifespan=lifespan
 )
 
 # 🔹 Agregar configuración de CORS
@@ -26,6 +51,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Permitir todos los métodos (GET, POST, PUT, DELETE)
     allow_headers=["*"],  # Permitir todos los headers
+    expose_headers=["X-Next-Cursor"],  # Cursor de paginación de /obtener-todo
 )
 
 # 🔹 Incluir rutas del usuario
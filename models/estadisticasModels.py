@@ -0,0 +1,17 @@
+from sqlalchemy import Column, Integer, Double, DateTime
+from config.db import Base
+
+class EstadisticasTransacciones(Base):
+    __tablename__ = "tbb_estadisticas_transacciones"
+    __table_args__ = {
+        'comment': 'Totales acumulados de las transacciones, actualizados en la misma unidad de trabajo que cada alta o cambio de estatus.'
+    }
+
+    id = Column(Integer, primary_key=True, comment="Identificador del registro de totales (siempre 1)")
+    total_ingresos = Column(Double, nullable=False, default=0, comment="Suma de los ingresos pagados")
+    total_egresos = Column(Double, nullable=False, default=0, comment="Suma de los egresos pagados")
+    transacciones_totales = Column(Integer, nullable=False, default=0, comment="Número total de transacciones registradas")
+    fecha_actualizacion = Column(DateTime, nullable=True, comment="Fecha de la última actualización de los totales")
+
+    def __repr__(self):
+        return f"<EstadisticasTransacciones(ingresos={self.total_ingresos}, egresos={self.total_egresos}, total={self.transacciones_totales})>"
@@ -0,0 +1,19 @@
+from sqlalchemy import Column, BigInteger, Integer, String, DateTime, JSON, Index
+from config.db import Base
+
+class EventoTransaccion(Base):
+    __tablename__ = "tbb_eventos_transacciones"
+    __table_args__ = (
+        # La compactación borra por antigüedad
+        Index("ix_eventos_transacciones_fecha", "fecha_registro"),
+        {'comment': 'Bandeja de salida de los cambios de transacciones; se escribe en la misma transacción que el cambio y permite reenviar a los clientes del websocket lo que no recibieron.'}
+    )
+
+    # En SQLite solo INTEGER PRIMARY KEY es autoincremental
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True, comment="Identificador del evento, creciente")
+    accion = Column(String(40), nullable=False, comment="Acción enviada por el websocket (transaccion_creada, ...)")
+    datos = Column(JSON, nullable=False, comment="Contenido del mensaje: la transacción o transacciones afectadas")
+    fecha_registro = Column(DateTime, nullable=False, comment="Fecha en que se registró el evento")
+
+    def __repr__(self):
+        return f"<EventoTransaccion(id={self.id}, accion={self.accion})>"
@@ -0,0 +1,18 @@
+from sqlalchemy import Column, Integer, String, DateTime
+from config.db import Base
+
+class Fotografia(Base):
+    __tablename__ = "tbb_fotografias"
+    __table_args__ = {
+        'comment': 'Archivos de fotografías guardados por su contenido (SHA-256); varias personas pueden compartir el mismo archivo.'
+    }
+
+    sha256 = Column(String(64), primary_key=True, comment="Hash SHA-256 del contenido, en hexadecimal")
+    ruta = Column(String(100), nullable=False, comment="Ruta del archivo, la misma que se guarda en tbb_personas.fotografia")
+    tipo_contenido = Column(String(30), nullable=False, comment="Tipo MIME detectado del contenido (image/jpeg, ...)")
+    tamano = Column(Integer, nullable=False, comment="Tamaño del archivo en bytes")
+    referencias = Column(Integer, nullable=False, default=0, comment="Personas que usan el archivo; en 0 el archivo se puede borrar")
+    fecha_registro = Column(DateTime, nullable=False, comment="Fecha en que se guardó el archivo por primera vez")
+
+    def __repr__(self):
+        return f"<Fotografia(sha256={self.sha256}, referencias={self.referencias})>"
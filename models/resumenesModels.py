@@ -0,0 +1,26 @@
+from sqlalchemy import Column, Integer, Double, Enum, DateTime
+from enum import Enum as PyEnum
+from config.db import Base
+from models.transaccionsModels import TipoTransaccion, MetodoPago, EstatusTransaccion
+
+class GranularidadResumen(str, PyEnum):
+    HORA = "hora"
+    DIA = "dia"
+    MES = "mes"
+
+class ResumenTransacciones(Base):
+    __tablename__ = "tbb_resumen_transacciones"
+    __table_args__ = {
+        'comment': 'Sumas y conteos de transacciones por intervalo de tiempo, tipo, método de pago y estatus.'
+    }
+
+    granularidad = Column(Enum(GranularidadResumen), primary_key=True, comment="Tamaño del intervalo (hora, dia, mes)")
+    periodo = Column(DateTime, primary_key=True, comment="Fecha y hora de inicio del intervalo")
+    tipo_transaccion = Column(Enum(TipoTransaccion), primary_key=True)
+    metodo_pago = Column(Enum(MetodoPago), primary_key=True)
+    estatus = Column(Enum(EstatusTransaccion), primary_key=True)
+    monto_total = Column(Double, nullable=False, default=0, comment="Suma de los montos del intervalo")
+    cantidad = Column(Integer, nullable=False, default=0, comment="Número de transacciones del intervalo")
+
+    def __repr__(self):
+        return f"<ResumenTransacciones(granularidad={self.granularidad}, periodo={self.periodo}, monto_total={self.monto_total}, cantidad={self.cantidad})>"
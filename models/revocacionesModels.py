@@ -0,0 +1,21 @@
+from sqlalchemy import Column, BigInteger, Integer, String, Double, Index
+from config.db import Base
+
+class RevocacionToken(Base):
+    __tablename__ = "tbb_revocaciones_tokens"
+    __table_args__ = (
+        # Los workers leen las recientes; la compactación borra las que ya expiraron
+        Index("ix_revocaciones_tokens_revocado", "revocado_en"),
+        Index("ix_revocaciones_tokens_expira", "expira"),
+        {'comment': 'Tokens cerrados con /logout y usuarios cuyos tokens anteriores dejan de valer; cada worker las copia a su memoria.'}
+    )
+
+    # En SQLite solo INTEGER PRIMARY KEY es autoincremental
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True, comment="Identificador de la revocación")
+    jti = Column(String(64), nullable=True, comment="Identificador del token cerrado (null si se revocan todos los de un usuario)")
+    usuario_id = Column(Integer, nullable=True, comment="Usuario cuyos tokens emitidos antes de revocado_en dejan de valer")
+    revocado_en = Column(Double, nullable=False, comment="Momento de la revocación (segundos epoch, como el iat del token)")
+    expira = Column(Double, nullable=False, comment="Momento desde el que ya no hace falta recordarla (segundos epoch)")
+
+    def __repr__(self):
+        return f"<RevocacionToken(id={self.id}, jti={self.jti}, usuario_id={self.usuario_id})>"
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Enum, DateTime, ForeignKey, func
+from sqlalchemy import Column, Integer, String, Float, Enum, DateTime, ForeignKey, Index, func
 from sqlalchemy.orm import relationship
 from enum import Enum as PyEnum
 from config.db import Base
@@ -21,6 +21,18 @@ class EstatusTransaccion(str, PyEnum):
  
 class Transaccion(Base):
     __tablename__ = "tbb_transacciones"
+    # Índices pensados para los filtros de obtener_todas_transacciones: cada filtro
+    # de igualdad va primero y después fecha_registro. InnoDB agrega la llave
+    # primaria (id) al final de cada índice secundario, así que el orden de la
+    # paginación (fecha_registro, id) y el rango de fechas se resuelven con el índice.
+    __table_args__ = (
+        Index("ix_transacciones_fecha", "fecha_registro"),
+        Index("ix_transacciones_usuario_fecha", "usuario_id", "fecha_registro"),
+        Index("ix_transacciones_tipo_fecha", "tipo_transaccion", "fecha_registro"),
+        Index("ix_transacciones_metodo_fecha", "metodo_pago", "fecha_registro"),
+        Index("ix_transacciones_estatus_fecha", "estatus", "fecha_registro"),
+        Index("ix_transacciones_tipo_estatus_fecha", "tipo_transaccion", "estatus", "fecha_registro"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True, index=True)
     usuario_id = Column(Integer, ForeignKey('tbd_usuarios_roles.Usuario_ID'), nullable=False)
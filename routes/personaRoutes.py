@@ -1,21 +1,38 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, UploadFile, status
+from fastapi.responses import FileResponse, RedirectResponse, Response
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
 from datetime import timedelta
-from config.db import get_db
+from email.utils import parsedate_to_datetime
+from typing import Optional
+from config.db import get_db, get_async_db
 from schemas.personaSchemas import PersonaCreate, PersonaUpdate, Persona
 from models.personasModels import Persona, Estatus
 from models.usersModels import Usuario
 from models.usuarioRolesModels import UsuarioRol
 from models.rolesModels import Rol
-from schemas.personaSchemas import PersonaCreate, PersonaUpdate
+from schemas.personaSchemas import PersonaCreate, PersonaUpdate, ReporteImportacion
 from schemas.userSchemas import UsuarioCreate
 from crud.personasCrud import update_persona
-from config.jwt import get_current_user
-import bcrypt
+from config.jwt import get_current_user, require_roles
+from config.hashing import hash_contrasena_bloqueante
+from config.cache import CacheTTL
+from models.fotografiasModels import Fotografia
+import os
 import time
+import threading
 
-from crud.personasCrud import create_persona
+from crud.personasCrud import create_persona, importar_personas, leer_filas_importacion, asignar_fotografia
+from crud.fotografiasCrud import (
+    recibir_fotografia,
+    descartar_temporal,
+    obtener_variante,
+    es_sha256,
+    sha256_de_ruta,
+    TAMANO_MAXIMO_FOTOGRAFIA,
+    TAMANOS_VARIANTES,
+)
 
 # Inicializamos el enrutador de personas
 persona = APIRouter(
@@ -26,13 +43,157 @@ persona = APIRouter(
     
 @persona.post("/register-personas", response_model=dict, tags=["Personas"])
 def registrar_persona(persona_data: PersonaCreate, db: Session = Depends(get_db)):
-    hashed_password = bcrypt.hashpw(persona_data.contrasena.encode('utf-8'), bcrypt.gensalt())
-    persona_data.contrasena = hashed_password.decode('utf-8')
+    # El hash se calcula en el pool dedicado (503 si está saturado)
+    persona_data.contrasena = hash_contrasena_bloqueante(persona_data.contrasena)
     return create_persona(db, persona_data)
 
+# Una importación a la vez: cada una ya ocupa todos los procesos de cifrado
+_importacion_en_proceso = threading.Lock()
+
+@persona.post("/importar", response_model=ReporteImportacion, tags=["Personas"])
+def importar_personas_archivo(
+    archivo: UploadFile = File(..., description="CSV con encabezados o NDJSON, una persona por fila"),
+    formato: str = Query(None, pattern="^(ndjson|csv)$", description="Formato del archivo; si se omite, se toma de la extensión"),
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(require_roles("Gerente"))
+):
+    """
+    Registra muchas personas (con su usuario y rol Cliente) desde un archivo.
+    Cada fila lleva los campos de /register-personas. Devuelve el resultado de cada fila.
+    """
+    if formato is None:
+        formato = "csv" if (archivo.filename or "").lower().endswith(".csv") else "ndjson"
+    if not _importacion_en_proceso.acquire(blocking=False):
+        raise HTTPException(status_code=409, detail="Ya hay una importación de personas en proceso")
+    filas = leer_filas_importacion(archivo.file, formato)
+    try:
+        return importar_personas(db, filas)
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="El archivo debe estar codificado en UTF-8; los lotes anteriores al error ya se guardaron")
+    finally:
+        filas.close()
+        _importacion_en_proceso.release()
+
 @persona.put("/{id}", response_model=PersonaUpdate)
 def actualizar_persona(id: int, persona: PersonaUpdate, db: Session = Depends(get_db), current_user: Usuario = Depends(get_current_user)):
     db_persona = update_persona(db, id, persona)
     if db_persona is None:
         raise HTTPException(status_code=404, detail="Persona no encontrada")
     return db_persona
+
+@persona.put("/{id}/fotografia", tags=["Personas"])
+async def subir_fotografia(
+    id: int,
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Usuario = Depends(get_current_user)
+):
+    """
+    Recibe la imagen (JPEG, PNG o WEBP) como cuerpo de la petición y la guarda
+    por su contenido: si otra persona ya tiene la misma foto, se comparte el archivo.
+    """
+    longitud = request.headers.get("content-length", "")
+    if longitud.isdigit() and int(longitud) > TAMANO_MAXIMO_FOTOGRAFIA:
+        raise HTTPException(status_code=413, detail=f"La fotografía no puede pesar más de {TAMANO_MAXIMO_FOTOGRAFIA // (1024 * 1024)} MB")
+
+    subida = await recibir_fotografia(request.stream())
+    try:
+        return await db.run_sync(asignar_fotografia, id, subida)
+    finally:
+        descartar_temporal(subida)
+
+# El contenido de /personas/fotografias/{sha256} nunca cambia: el navegador lo
+# puede guardar un año sin volver a preguntar. Es privado porque requiere sesión;
+# los proxies compartidos no deben guardarlo
+CACHE_FOTOGRAFIA_INMUTABLE = "private, max-age=31536000, immutable"
+# sha256 -> (ruta, tipo de contenido); evita consultar tbb_fotografias en cada imagen de una lista
+cache_fotografias = CacheTTL(max_elementos=4096, ttl_segundos=300)
+
+def _validar_tamano(tamano: Optional[int]) -> None:
+    if tamano is not None and tamano not in TAMANOS_VARIANTES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Tamaño no disponible; usa uno de {', '.join(map(str, TAMANOS_VARIANTES))}"
+        )
+
+def _no_modificada(request: Request, etag: str, ruta: str) -> bool:
+    """
+    Revisa If-None-Match / If-Modified-Since para responder 304 sin enviar el archivo.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        etiquetas = [e.strip().removeprefix("W/") for e in if_none_match.split(",")]
+        return "*" in etiquetas or etag in etiquetas
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(os.stat(ruta).st_mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+@persona.get("/fotografias/{sha256}", tags=["Personas"])
+async def servir_fotografia(
+    sha256: str,
+    request: Request,
+    tamano: Optional[int] = Query(None, description="Lado mayor de la variante reducida; sin valor se envía la original"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Usuario = Depends(get_current_user)
+):
+    """
+    Envía la fotografía guardada con ese hash, o una variante reducida que se
+    genera en segundo plano la primera vez que se pide. Soporta Range y
+    peticiones condicionales (ETag / Last-Modified).
+    """
+    _validar_tamano(tamano)
+    fotografia = cache_fotografias.obtener(sha256) if es_sha256(sha256) else None
+    if fotografia is None and es_sha256(sha256):
+        registro = await db.get(Fotografia, sha256)
+        if registro is not None:
+            fotografia = (registro.ruta, registro.tipo_contenido)
+            cache_fotografias.guardar(sha256, fotografia)
+    if fotografia is None or not os.path.exists(fotografia[0]):
+        cache_fotografias.invalidar(sha256)
+        raise HTTPException(status_code=404, detail="Fotografía no encontrada")
+
+    ruta, tipo_contenido = fotografia
+    cache_control = CACHE_FOTOGRAFIA_INMUTABLE
+    variante = await obtener_variante(ruta, tamano) if tamano else None
+    if variante is not None:
+        ruta = variante
+    elif tamano:
+        # Sin Pillow o sin poder reducirla se envía la original, sin guardarla
+        # en caché como si fuera la variante
+        cache_control = "private, no-cache"
+        tamano = None
+
+    etag = f'"{sha256}-{tamano or "original"}"'
+    cabeceras = {"ETag": etag, "Cache-Control": cache_control}
+    if _no_modificada(request, etag, ruta):
+        return Response(status_code=304, headers=cabeceras)
+    return FileResponse(ruta, media_type=tipo_contenido, headers=cabeceras)
+
+@persona.get("/{id}/fotografia", tags=["Personas"])
+async def fotografia_persona(
+    id: int,
+    tamano: Optional[int] = Query(None, description="Lado mayor de la variante reducida"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Usuario = Depends(get_current_user)
+):
+    """
+    Redirige a la dirección permanente de la fotografía actual de la persona.
+    """
+    _validar_tamano(tamano)
+    db_persona = await db.get(Persona, id)
+    if db_persona is None or not db_persona.fotografia:
+        raise HTTPException(status_code=404, detail="Fotografía no encontrada")
+
+    sha256 = sha256_de_ruta(db_persona.fotografia)
+    if sha256 is None:
+        # Fotografía anterior al guardado por contenido: se envía tal cual
+        if not os.path.exists(db_persona.fotografia):
+            raise HTTPException(status_code=404, detail="Fotografía no encontrada")
+        return FileResponse(db_persona.fotografia, headers={"Cache-Control": "no-cache"})
+
+    url = f"{persona.prefix}/fotografias/{sha256}" + (f"?tamano={tamano}" if tamano else "")
+    return RedirectResponse(url, status_code=307, headers={"Cache-Control": "no-cache"})
@@ -1,16 +1,22 @@
 import asyncio
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+import logging
+import threading
+import anyio
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Response, status
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
 from datetime import datetime
 from typing import Optional, List
 from crud.transaccionsCrud import obtener_usuarios_por_transaccion  # en lugar de obtener_usuarios_por_rol
-from config.db import get_db
+from config.db import get_db, get_async_db, SessionLocal, AsyncSessionLocal
 from fastapi import WebSocket
+from fastapi.responses import StreamingResponse
 from asyncio import create_task
 from models.transaccionsModels import Transaccion
 from models.usuarioRolesModels import UsuarioRol
 from fastapi.encoders import jsonable_encoder
+from pydantic import ValidationError
 from sqlalchemy.orm import joinedload
 from webSocket.websocket import manager
 from fastapi.encoders import jsonable_encoder
@@ -22,28 +28,96 @@ from schemas.transaccionSchemas import (
     TipoTransaccion,
     MetodoPago,
     EstatusTransaccion,
-    TransaccionEstadisticas
+    TransaccionEstadisticas,
+    GranularidadSerie,
+    TransaccionSerie,
+    TransaccionBalanceUsuario,
+    SuscripcionTransacciones
 )
-from config.jwt import get_current_user
+from config.jwt import get_current_user, require_roles
 from crud.transaccionsCrud import (
     crear_transaccion,
     obtener_transaccion,
     obtener_todas_transacciones,
-    obtener_usuarios_por_rol
+    obtener_usuarios_por_rol,
+    codificar_cursor,
+    exportar_transacciones,
+    obtener_balances,
+    obtener_datos_usuario_async,
+    crear_transaccion_async,
+    crear_transacciones_lote_async,
+    actualizar_transaccion_async
 )
+from crud.estadisticasCrud import obtener_estadisticas, obtener_estadisticas_async, reconstruir_estadisticas
+from crud.eventosCrud import tomar_eventos, mensaje_evento, obtener_eventos_desde_async
+from seeders.transaccionesGenerador import generar_transacciones
+from crud.resumenesCrud import obtener_series, reconstruir_resumenes
+from models.resumenesModels import GranularidadResumen
+
+logger = logging.getLogger(__name__)
 
 # Inicializamos el enrutador de transacciones
 transaccion = APIRouter()
 
+async def _reproducir_eventos(websocket: WebSocket, ultimo_evento_id: int):
+    """
+    Reenvía a la conexión los eventos posteriores a `ultimo_evento_id` desde la
+    bandeja de salida; si ya no están disponibles se le pide recargar todo.
+    """
+    manager.iniciar_reproduccion(websocket)
+    mensajes = None
+    estadisticas = None
+    try:
+        async with AsyncSessionLocal() as db:
+            eventos = await obtener_eventos_desde_async(db, ultimo_evento_id)
+            estadisticas = await obtener_estadisticas_async(db)
+        if eventos is not None:
+            mensajes = [mensaje_evento(evento) for evento in eventos]
+    except Exception:
+        logger.exception("Error al reenviar eventos de transacciones")
+    await manager.terminar_reproduccion(websocket, mensajes, ultimo_evento_id, estadisticas)
+
 @transaccion.websocket("/ws/transacciones")
-async def websocket_transacciones(websocket: WebSocket):
+async def websocket_transacciones(websocket: WebSocket, last_event_id: Optional[int] = None):
+    """
+    Envía los cambios de transacciones. El cliente puede mandar
+    {"action": "suscribir", "filtros": {...}} con los mismos filtros de
+    /obtener-todo para recibir solo lo que le interesa.
+
+    Al reconectarse, el cliente manda el mayor "event_id" que aplicó (en la
+    URL como ?last_event_id=N, o como "last_event_id" en el mensaje de
+    suscripción) y recibe los eventos que se perdió. Puede recibir de nuevo
+    algunos que ya tenía: debe ignorar los event_id ya aplicados.
+    """
     await manager.connect(websocket)
     try:
+        if last_event_id is not None:
+            await _reproducir_eventos(websocket, last_event_id)
         while True:
-            await websocket.receive_text()  # Se mantiene la conexión abierta esperando datos
+            texto = await websocket.receive_text()
+            try:
+                mensaje = json.loads(texto)
+                if not isinstance(mensaje, dict) or mensaje.get("action") != "suscribir":
+                    continue
+                filtros = SuscripcionTransacciones.model_validate(mensaje.get("filtros") or {})
+            except (ValueError, ValidationError) as e:
+                await manager.enviar(websocket, {"action": "error", "detail": f"Suscripción inválida: {e}"})
+                continue
+            filtros = jsonable_encoder(filtros)
+            manager.suscribir(websocket, filtros)
+            await manager.enviar(websocket, {"action": "suscrito", "filtros": filtros})
+            if isinstance(mensaje.get("last_event_id"), int):
+                await _reproducir_eventos(websocket, mensaje["last_event_id"])
     except Exception:
         manager.disconnect(websocket)  # Si algo sale mal, desconectamos al cliente
 
+@transaccion.get("/ws/transacciones/metricas", tags=["Transacciones"])
+def metricas_websocket_transacciones(current_user: dict = Depends(get_current_user)):
+    """
+    Conexiones activas, profundidad de las colas de envío y mensajes descartados.
+    """
+    return manager.metricas()
+
 @transaccion.get("/transacciones/estadisticas", response_model=TransaccionEstadisticas, tags=["Transacciones"])
 def get_estadisticas_transacciones(
     db: Session = Depends(get_db), 
@@ -53,41 +127,139 @@ def get_estadisticas_transacciones(
     Obtiene estadísticas generales de las transacciones.
     """
     try:
-        query = text("SELECT * FROM vw_estadisticas_transacciones")
-        result = db.execute(query).fetchone()
-
-        if not result:
-            raise HTTPException(status_code=404, detail="No hay datos estadísticos disponibles.")
-
-        return {
-            "total_ingresos": result[0],
-            "total_egresos": result[1],
-            "balance_general": result[2],
-            "transacciones_totales": result[3]
-        }
+        return obtener_estadisticas(db)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@transaccion.post("/generar-transacciones/", tags=["Transacciones"])
-def generar_transacciones_masivas(
-    cantidad: int,
+@transaccion.post("/transacciones/estadisticas/reconstruir", response_model=TransaccionEstadisticas, tags=["Transacciones"])
+def reconstruir_estadisticas_transacciones(
     db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_user)
 ):
     """
-    Genera transacciones ficticias en la base de datos mediante un procedimiento almacenado.
+    Recalcula los totales acumulados y los resúmenes por periodo a partir de
+    toda la tabla de transacciones.
     """
     try:
-        db.execute(
-            text("CALL sp_genera_transacciones(:cantidad)"),
-            {"cantidad": cantidad}
-        )
-        db.commit()
-        return {"message": f"Se generaron {cantidad} transacciones correctamente."}
+        reconstruir_estadisticas(db, commit=False)
+        reconstruir_resumenes(db)
+        return obtener_estadisticas(db)
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
+@transaccion.get("/transacciones/series", response_model=List[TransaccionSerie], tags=["Transacciones"])
+def get_series_transacciones(
+    granularidad: GranularidadSerie = Query(GranularidadSerie.DIA, description="Tamaño del intervalo (hora/dia/mes)"),
+    fecha_inicio: Optional[datetime] = Query(None, description="Fecha de inicio (YYYY-MM-DD)"),
+    fecha_fin: Optional[datetime] = Query(None, description="Fecha fin (YYYY-MM-DD)"),
+    tipo_transaccion: Optional[TipoTransaccion] = Query(None, description="Tipo de transacción (Ingreso/Egreso)"),
+    metodo_pago: Optional[MetodoPago] = Query(None, description="Método de pago"),
+    estatus: Optional[EstatusTransaccion] = Query(None, description="Estatus de transacción"),
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Obtiene sumas y conteos por intervalo, desglosados por tipo, método de pago y estatus.
+    """
+    try:
+        return obtener_series(
+            db,
+            GranularidadResumen(granularidad.value),
+            fecha_inicio=fecha_inicio,
+            fecha_fin=fecha_fin,
+            tipo_transaccion=tipo_transaccion,
+            metodo_pago=metodo_pago,
+            estatus=estatus
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Número máximo de usuarios por consulta de balances
+MAX_USUARIOS_BALANCES = 1000
+
+@transaccion.get("/transacciones/balances", response_model=List[TransaccionBalanceUsuario], tags=["Transacciones"])
+def get_balances_usuarios(
+    usuario_ids: Optional[List[int]] = Query(None, description="IDs de usuario (se puede repetir)"),
+    rol: Optional[str] = Query(None, description="Nombre del rol, por ejemplo Cliente"),
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Obtiene ingresos, egresos y balance de varios usuarios con una sola consulta.
+    """
+    if not usuario_ids and not rol:
+        raise HTTPException(status_code=400, detail="Se requiere usuario_ids o rol")
+
+    try:
+        return obtener_balances(db, usuario_ids=usuario_ids, rol=rol, limite=MAX_USUARIOS_BALANCES)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Estado del último trabajo de generación de transacciones (por proceso)
+estado_generacion = {"en_proceso": False, "resultado": None, "error": None}
+# Una generación a la vez; la toma la ruta y la suelta la tarea al terminar
+_generacion_en_proceso = threading.Lock()
+
+def _ejecutar_generacion(cantidad: int, semilla: int):
+    db = SessionLocal()
+    try:
+        estado_generacion.update(en_proceso=True, resultado=None, error=None)
+        resultado = generar_transacciones(db, cantidad, semilla=semilla)
+        estado_generacion["resultado"] = resultado
+        logger.info("Generación de transacciones terminada: %s", resultado)
+        # Una sola señal al terminar, no una por fila; son demasiadas filas para
+        # mandarlas, así que los clientes vuelven a consultar todo
+        eventos = tomar_eventos(db)
+        anyio.from_thread.run(manager.broadcast, {
+            "action": "actualizar_transacciones",
+            "estadisticas": obtener_estadisticas(db),
+            "event_id": eventos[-1].id if eventos else None
+        })
+    except Exception as e:
+        # Queda en /generar-transacciones/estado para quien lanzó la generación
+        estado_generacion["error"] = f"{type(e).__name__}: {e}"
+        logger.exception("Error al generar transacciones")
+    finally:
+        estado_generacion["en_proceso"] = False
+        db.close()
+        _generacion_en_proceso.release()
+
+@transaccion.post("/generar-transacciones/", tags=["Transacciones"])
+def generar_transacciones_masivas(
+    cantidad: int,
+    background_tasks: BackgroundTasks,
+    semilla: int = 42,
+    current_user: dict = Depends(require_roles("Gerente"))
+):
+    """
+    Genera transacciones ficticias en segundo plano, de forma determinista según la semilla.
+    Solo para gerentes.
+    """
+    if cantidad <= 0:
+        raise HTTPException(status_code=400, detail="La cantidad debe ser mayor a 0")
+    if not _generacion_en_proceso.acquire(blocking=False):
+        raise HTTPException(status_code=409, detail="Ya hay una generación de transacciones en proceso")
+
+    estado_generacion["en_proceso"] = True
+    try:
+        background_tasks.add_task(_ejecutar_generacion, cantidad, semilla)
+    except Exception:
+        estado_generacion["en_proceso"] = False
+        _generacion_en_proceso.release()
+        raise
+    return {"message": f"Se inició la generación de {cantidad} transacciones."}
+
+@transaccion.get("/generar-transacciones/estado", tags=["Transacciones"])
+def estado_generacion_transacciones(current_user: dict = Depends(get_current_user)):
+    """
+    Indica si hay una generación en proceso y el resultado (filas por segundo) de la
+    última, o el error con el que terminó.
+    """
+    return estado_generacion
+
 @transaccion.get("/obtener-usuarios-por-transaccion", tags=["Transacciones"])
 def obtener_usuarios_por_transaccion_route(
     tipo_transaccion: str = Query(...),
@@ -108,48 +280,60 @@ def obtener_usuarios_por_transaccion_route(
     return usuarios
 
 
+async def construir_respuesta_transaccion(db: AsyncSession, transaccion: Transaccion) -> TransaccionResponse:
+    """
+    Arma la respuesta con los valores ya cargados de la transacción y el nombre
+    de usuario y rol obtenidos de la caché, sin volver a leer la fila.
+    """
+    nombre_usuario, rol = await obtener_datos_usuario_async(db, transaccion.usuario_id) or (None, None)
+
+    return TransaccionResponse(
+        id=transaccion.id,
+        detalles=transaccion.detalles,
+        tipo_transaccion=transaccion.tipo_transaccion,
+        metodo_pago=transaccion.metodo_pago,
+        monto=transaccion.monto,
+        estatus=transaccion.estatus,
+        usuario_id=transaccion.usuario_id,
+        fecha_registro=transaccion.fecha_registro,
+        fecha_actualizacion=transaccion.fecha_actualizacion,
+        nombre_usuario=nombre_usuario,
+        rol=rol
+    )
+
+async def notificar_eventos(db: AsyncSession):
+    """
+    Envía a los clientes los eventos que se guardaron con el último commit y
+    los totales ya actualizados, para que apliquen la diferencia sin volver a
+    consultar /obtener-todo ni /transacciones/estadisticas. Solo si detectan un
+    salto en "seq" recargan todo.
+    """
+    eventos = tomar_eventos(db)
+    if not eventos:
+        return
+    estadisticas = await obtener_estadisticas_async(db)
+    for evento in eventos:
+        await manager.broadcast({**mensaje_evento(evento), "estadisticas": estadisticas})
+
 @transaccion.post("/register-tra/", response_model=TransaccionResponse, tags=["Transacciones"])
 async def registrar_transaccion(
     transaccion_data: TransaccionCreate, 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     try:
-        nueva_transaccion = crear_transaccion(db, transaccion_data.model_dump())
-        db.refresh(nueva_transaccion)
+        # Se valida el usuario antes del INSERT; con la caché caliente no cuesta una consulta
+        if await obtener_datos_usuario_async(db, transaccion_data.usuario_id) is None:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Usuario no encontrado")
+
+        nueva_transaccion = await crear_transaccion_async(db, transaccion_data.model_dump())
 
         if not nueva_transaccion:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Error al crear la transacción")
 
-        transaccion_con_datos = db.query(Transaccion).options(
-            joinedload(Transaccion.usuario_rol).joinedload(UsuarioRol.usuario),
-            joinedload(Transaccion.usuario_rol).joinedload(UsuarioRol.rol)
-        ).filter(Transaccion.id == nueva_transaccion.id).one_or_none()
-
-        if not transaccion_con_datos:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Transacción no encontrada")
-
-        usuario_rol = transaccion_con_datos.usuario_rol
-        nombre_usuario = usuario_rol.usuario.nombre_usuario if usuario_rol and usuario_rol.usuario else None
-        rol = usuario_rol.rol.Nombre if usuario_rol and usuario_rol.rol else None
-
-        transaccion_response = TransaccionResponse(
-            id=transaccion_con_datos.id,
-            detalles=transaccion_con_datos.detalles,
-            tipo_transaccion=transaccion_con_datos.tipo_transaccion,
-            metodo_pago=transaccion_con_datos.metodo_pago,
-            monto=transaccion_con_datos.monto,
-            estatus=transaccion_con_datos.estatus,
-            usuario_id=transaccion_con_datos.usuario_id,
-            fecha_registro=transaccion_con_datos.fecha_registro,
-            fecha_actualizacion=transaccion_con_datos.fecha_actualizacion,
-            nombre_usuario=nombre_usuario,
-            rol=rol
-        )
+        transaccion_response = await construir_respuesta_transaccion(db, nueva_transaccion)
 
-        # ✅ Solo mandamos una señal, no la lista completa
-        await manager.broadcast({
-            "action": "actualizar_transacciones"
-        })
+        # Solo la transacción nueva y los totales, no la lista completa
+        await notificar_eventos(db)
 
         return transaccion_response
 
@@ -162,24 +346,54 @@ async def registrar_transaccion(
         )
 
 
+# Número máximo de transacciones aceptadas por lote
+MAX_TRANSACCIONES_LOTE = 1000
+
+@transaccion.post("/register-tra/batch", response_model=List[TransaccionResponse], tags=["Transacciones"])
+async def registrar_transacciones_lote(
+    transacciones_data: List[TransaccionCreate],
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Registra un lote de transacciones con un solo INSERT de varias filas y una sola notificación.
+    """
+    if not transacciones_data:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="El lote está vacío")
+    if len(transacciones_data) > MAX_TRANSACCIONES_LOTE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"El lote no puede tener más de {MAX_TRANSACCIONES_LOTE} transacciones"
+        )
+
+    creadas = await crear_transacciones_lote_async(db, [t.model_dump() for t in transacciones_data])
+
+    # Un solo mensaje para todo el lote
+    await notificar_eventos(db)
+
+    return creadas
+
 @transaccion.get("/obtener-todo", response_model=List[TransaccionResponse], tags=["Transacciones"])
 def listar_todas_transacciones(
+    response: Response,
     db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_user),
     skip: int = Query(0, description="Número de registros a saltar"),
-    limit: int = Query(100, description="Límite de registros por página", le=200),
+    limit: int = Query(100, description="Límite de registros por página", ge=1, le=200),
     tipo_transaccion: Optional[TipoTransaccion] = Query(None, description="Tipo de transacción (Ingreso/Egreso)"),
     metodo_pago: Optional[MetodoPago] = Query(None, description="Método de pago"),
     estatus: Optional[EstatusTransaccion] = Query(None, description="Estatus de transacción"),
     usuario_id: Optional[int] = Query(None, description="ID de usuario"),
     fecha_inicio: Optional[datetime] = Query(None, description="Fecha de inicio (YYYY-MM-DD)"),
-    fecha_fin: Optional[datetime] = Query(None, description="Fecha fin (YYYY-MM-DD)")
+    fecha_fin: Optional[datetime] = Query(None, description="Fecha fin (YYYY-MM-DD)"),
+    cursor: Optional[str] = Query(None, description="Cursor devuelto en X-Next-Cursor; si se envía, se ignora skip")
 ):
     """
     Obtiene todas las transacciones con opciones de filtrado y paginación.
+
+    Cuando la página viene completa se devuelve en el encabezado X-Next-Cursor
+    el cursor para pedir la siguiente.
     """
     try:
-        print(f"Parámetros recibidos: skip={skip}, tipo_transaccion={tipo_transaccion}, metodo_pago={metodo_pago}, estatus={estatus}, usuario_id={usuario_id}, fecha_inicio={fecha_inicio}, fecha_fin={fecha_fin}")
         transacciones = obtener_todas_transacciones(
             db=db,
             skip=skip,
@@ -188,17 +402,83 @@ def listar_todas_transacciones(
             estatus=estatus,
             usuario_id=usuario_id,
             fecha_inicio=fecha_inicio,
-            fecha_fin=fecha_fin
+            fecha_fin=fecha_fin,
+            limit=limit,
+            cursor=cursor
         )
-        print(f"Transacciones obtenidas: {transacciones}")
+        if len(transacciones) == limit:
+            ultima = transacciones[-1]
+            response.headers["X-Next-Cursor"] = codificar_cursor(ultima.fecha_registro, ultima.id)
         return transacciones
+    except HTTPException as e:
+        raise e
     except Exception as e:
-        print(f"Error al obtener transacciones: {str(e)}")
+        logger.exception("Error al obtener transacciones")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error al obtener transacciones: {str(e)}"
         )
 
+@transaccion.get("/transacciones/exportar", tags=["Transacciones"])
+def exportar_transacciones_route(
+    current_user: dict = Depends(get_current_user),
+    formato: str = Query("ndjson", pattern="^(ndjson|csv)$", description="Formato de salida (ndjson/csv)"),
+    tipo_transaccion: Optional[TipoTransaccion] = Query(None, description="Tipo de transacción (Ingreso/Egreso)"),
+    metodo_pago: Optional[MetodoPago] = Query(None, description="Método de pago"),
+    estatus: Optional[EstatusTransaccion] = Query(None, description="Estatus de transacción"),
+    usuario_id: Optional[int] = Query(None, description="ID de usuario"),
+    fecha_inicio: Optional[datetime] = Query(None, description="Fecha de inicio (YYYY-MM-DD)"),
+    fecha_fin: Optional[datetime] = Query(None, description="Fecha fin (YYYY-MM-DD)")
+):
+    """
+    Exporta las transacciones filtradas como NDJSON o CSV sin cargarlas en memoria.
+    """
+    filtros = {
+        "tipo_transaccion": tipo_transaccion,
+        "metodo_pago": metodo_pago,
+        "estatus": estatus,
+        "usuario_id": usuario_id,
+        "fecha_inicio": fecha_inicio,
+        "fecha_fin": fecha_fin,
+    }
+
+    # La sesión de get_db se cierra antes de enviar la respuesta, por eso el
+    # flujo abre la suya y la mantiene mientras dure la descarga.
+    def generar():
+        db = SessionLocal()
+        try:
+            yield from exportar_transacciones(db, formato=formato, **filtros)
+        finally:
+            db.close()
+
+    media_type = "text/csv" if formato == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        generar(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="transacciones.{formato}"'}
+    )
+
+@transaccion.put("/{transaccion_id}", response_model=TransaccionResponse, tags=["Transacciones"])
+async def actualizar_transaccion_route(
+    transaccion_id: int,
+    transaccion_data: TransaccionUpdate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Actualiza una transacción (por ejemplo su estatus) y ajusta los totales.
+    """
+    db_transaccion = await actualizar_transaccion_async(db, transaccion_id, transaccion_data)
+    if not db_transaccion:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Transacción no encontrada"
+        )
+
+    transaccion_response = await construir_respuesta_transaccion(db, db_transaccion)
+    await notificar_eventos(db)
+    return transaccion_response
+
 @transaccion.get("/{transaccion_id}", response_model=TransaccionResponse, tags=["Transacciones"])
 def obtener_transaccion(
     transaccion_id: int, 
@@ -1,9 +1,10 @@
 from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.security import HTTPBearer
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta
-from config.db import get_db
+from config.db import get_db, get_async_db
 from schemas.userSchemas import UsuarioSimple
 from models.usuarioRolesModels import UsuarioRol 
 from models.usersModels import Usuario
@@ -14,14 +15,23 @@ from schemas.userSchemas import UsuarioSimple
 from typing import List
 from schemas.userSchemas import UsuarioLogin, Usuario, UsuarioCreate, UsuarioUpdate
 from crud.usersCrud import get_user_by_nombre_usuario
-from config.jwt import create_access_token, get_current_user
+from config.jwt import create_access_token, get_current_user, get_current_claims, revocar_token, cache_usuarios, ClaimsToken
+from config.hashing import obtener_metricas_hashing
+from config.limiter import verificar_limite, obtener_metricas_limites
 from crud.usersCrud import (
     authenticate_user,
     get_user as get_users_db,
     get_user as get_user_db,
     create_user as create_user,
-    get_user_by_nombre_usuario_or_email
+    get_user_by_nombre_usuario_or_email,
+    authenticate_user_async,
+    get_user_async,
+    get_user_by_nombre_usuario_async,
+    get_user_by_nombre_usuario_or_email_async,
+    get_roles_usuario_async,
+    create_user_async
 )
+from crud.personasCrud import get_persona_async
 
 user = APIRouter()
 security = HTTPBearer()
@@ -29,9 +39,12 @@ security = HTTPBearer()
 
 # ✅ Endpoint de autenticación
 @user.post("/login", response_model=dict, tags=["Autenticación"])
-async def login(user_data: UsuarioLogin, db: Session = Depends(get_db)):
+async def login(user_data: UsuarioLogin, request: Request, db: AsyncSession = Depends(get_async_db)):
+    # Limitar intentos antes de tocar la base o bcrypt
+    verificar_limite(request, user_data.nombre_usuario)
+
     # Autenticar al usuario
-    user = authenticate_user(
+    user = await authenticate_user_async(
         db, nombre_usuario=user_data.nombre_usuario, contrasena=user_data.contrasena
     )
     if not user:
@@ -41,72 +54,85 @@ async def login(user_data: UsuarioLogin, db: Session = Depends(get_db)):
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    # Verificar el rol del usuario
-    esGerente = False
+    # Roles activos del usuario: viajan en el token para autorizar sin consultar la base
     usuarioLogueado = user.nombre_usuario
-    usuario_rol = db.query(UsuarioRol).filter(UsuarioRol.Usuario_ID == user.id).first()
-    
-    if usuario_rol and usuario_rol.Rol_ID == 1:  # 1 = Rol de gerente
-        esGerente = True
+    roles = await get_roles_usuario_async(db, user.id)
+    esGerente = "Gerente" in roles
     
     # Generar el token JWT (para todos los usuarios, no solo gerentes)
     access_token_expires = timedelta(minutes=30)
     access_token = create_access_token(
-        data={"sub": user.nombre_usuario, "esGerente": esGerente},  # Incluir rol en el token
+        data={"sub": user.nombre_usuario, "uid": user.id, "roles": roles, "esGerente": esGerente},
         expires_delta=access_token_expires
     )
 
-    # Debug: Verificar el valor de esGerente
-    print(f"DEBUG - Valor de esGerente: {esGerente}")
-    print(f"DEBUG - Usuario: {user.nombre_usuario}, ID: {user.id}")
-    if usuario_rol:
-        print(f"DEBUG - Rol encontrado: ID {usuario_rol.Rol_ID}")
-    else:
-        print("DEBUG - No se encontró rol para el usuario")
-
     return {
         "access_token": access_token, 
         "token_type": "bearer",
         "esGerente": esGerente,
+        "roles": roles,
         "usuarioLogueado": usuarioLogueado    # También devolverlo en la respuesta directa
     }
 
+# ✅ Cerrar sesión: el token deja de aceptarse aunque no haya expirado
+@user.post("/logout", tags=["Autenticación"])
+def logout(claims: ClaimsToken = Depends(get_current_claims), db: Session = Depends(get_db)):
+    revocar_token(db, claims)
+    return {"message": "Sesión cerrada"}
+
 @user.post("/register", response_model=Usuario, tags=["Usuarios"])
-async def register_new_user(user_data: UsuarioCreate, db: Session = Depends(get_db)):
+async def register_new_user(user_data: UsuarioCreate, request: Request, db: AsyncSession = Depends(get_async_db)):
     """
     Endpoint para registrar un nuevo usuario
     """
+    verificar_limite(request, user_data.nombre_usuario)
+
     # Si 'estatus' no se proporciona, se usará el valor por defecto 'Activo'
     user_data.estatus = user_data.estatus or "Activo"
     
     # Verificar si el usuario ya existe por nombre de usuario o correo electrónico
-    existing_user = get_user_by_nombre_usuario_or_email(db=db, nombre_usuario=user_data.nombre_usuario, correo_electronico=user_data.correo_electronico)
+    existing_user = await get_user_by_nombre_usuario_or_email_async(db=db, nombre_usuario=user_data.nombre_usuario, correo_electronico=user_data.correo_electronico)
     
     if existing_user:
         raise HTTPException(status_code=400, detail="El usuario ya existe")
     
     # Si no existe, crear el usuario en la base de datos
-    return create_user(db=db, user=user_data)
+    return await create_user_async(db=db, user=user_data)
+
+# Aciertos y fallos de la caché de usuarios autenticados
+@user.get("/auth/cache", tags=["Autenticación"])
+def metricas_cache_autenticacion(current_user: Usuario = Depends(get_current_user)):
+    return cache_usuarios.metricas()
+
+# Estado del pool de cifrado de contraseñas
+@user.get("/auth/hashing", tags=["Autenticación"])
+def metricas_hashing_contrasenas(current_user: Usuario = Depends(get_current_user)):
+    return obtener_metricas_hashing()
+
+# Intentos permitidos y rechazados por el limitador de /login y /register
+@user.get("/auth/limites", tags=["Autenticación"])
+def metricas_limites_autenticacion(current_user: Usuario = Depends(get_current_user)):
+    return obtener_metricas_limites()
 
 # ✅ Obtener un usuario por ID (protegido)
 @user.get("/users/{id}", response_model=Usuario, tags=["Usuarios"])
-async def read_user(id: int, db: Session = Depends(get_db), current_user: Usuario = Depends(get_current_user)):
-    db_user = get_user_db(db=db, id=id)
+async def read_user(id: int, db: AsyncSession = Depends(get_async_db), current_user: Usuario = Depends(get_current_user)):
+    db_user = await get_user_async(db=db, id=id)
     if db_user is None:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
     return db_user
 
 @user.get("/usuario/{nombre_usuario}", tags=["Usuarios"])
-async def get_usuario_con_datos_persona(nombre_usuario: str, db: Session = Depends(get_db)):
+async def get_usuario_con_datos_persona(nombre_usuario: str, db: AsyncSession = Depends(get_async_db)):
     """
     Obtiene los datos completos del usuario y su información asociada en la tabla persona.
     """
-    usuario = get_user_by_nombre_usuario(db, nombre_usuario)
+    usuario = await get_user_by_nombre_usuario_async(db, nombre_usuario)
     if not usuario:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
 
     # Obtener los datos de la persona asociados
-    persona = db.query(Persona).filter(Persona.id == usuario.persona_id).first()
+    persona = await get_persona_async(db, usuario.persona_id)
     if not persona:
         raise HTTPException(status_code=404, detail="Persona asociada no encontrada")
 
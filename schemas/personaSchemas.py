@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import List, Optional
 from pydantic import BaseModel
 from datetime import datetime, date
 
@@ -15,7 +15,9 @@ class PersonaBase(BaseModel):
     estatus: str = "Activo"
 
 class PersonaCreate(PersonaBase):
-    pass
+    # Datos del usuario que se crea junto con la persona
+    correo_electronico: str
+    contrasena: str
 
 class PersonaUpdate(BaseModel):
     titulo_cortesia: Optional[str] = None
@@ -35,4 +37,18 @@ class Persona(PersonaBase):
     fecha_actualizacion: Optional[datetime] = None
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class FilaImportacion(BaseModel):
+    fila: int
+    estado: str  # "creado" o "error"
+    nombre_usuario: Optional[str] = None
+    persona_id: Optional[int] = None
+    error: Optional[str] = None
+
+class ReporteImportacion(BaseModel):
+    total: int
+    creados: int
+    errores: int
+    segundos: float
+    resultados: List[FilaImportacion]
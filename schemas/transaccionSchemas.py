@@ -57,8 +57,41 @@ class TransaccionBalance(BaseModel):
     usuario_id: int
     balance: float
 
+class GranularidadSerie(str, Enum):
+    HORA = "hora"
+    DIA = "dia"
+    MES = "mes"
+
+class TransaccionSerie(BaseModel):
+    periodo: datetime
+    tipo_transaccion: TipoTransaccion
+    metodo_pago: MetodoPago
+    estatus: EstatusTransaccion
+    monto_total: float
+    cantidad: int
+
+    class Config:
+        from_attributes = True
+
+class TransaccionBalanceUsuario(BaseModel):
+    usuario_id: int
+    total_ingresos: float
+    total_egresos: float
+    balance: float
+
 class TransaccionEstadisticas(BaseModel):
     total_ingresos: float
     total_egresos: float
     balance_general: float
-    transacciones_totales: int
\ No newline at end of file
+    transacciones_totales: int
+
+
+class SuscripcionTransacciones(BaseModel):
+    """
+    Filtros que un cliente de /ws/transacciones envía para recibir solo los
+    cambios que le interesan; los campos vacíos aceptan cualquier valor.
+    """
+    tipo_transaccion: Optional[TipoTransaccion] = None
+    metodo_pago: Optional[MetodoPago] = None
+    estatus: Optional[EstatusTransaccion] = None
+    usuario_id: Optional[int] = None
@@ -0,0 +1,91 @@
+"""
+Mide la latencia del event loop durante una ráfaga de verificaciones de
+contraseña, como las que hace /login.
+
+Compara dos modos:
+- bloqueante: bcrypt se calcula directamente en el event loop (como antes).
+- pool: bcrypt pasa por el pool dedicado de config.hashing.
+
+Mientras corre la ráfaga, una tarea duerme 10 ms una y otra vez y registra
+cuánto tarda de más en despertar; eso es lo que esperaría cualquier otra
+petición o mensaje del websocket en ese proceso.
+
+Uso (desde la raíz del proyecto):
+    python -m scripts.benchmark_login
+    python -m scripts.benchmark_login --logins 200 --modo pool
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from fastapi import HTTPException
+
+from config.hashing import pwd_context, verificar_contrasena, obtener_metricas_hashing
+
+INTERVALO_MONITOR = 0.010
+
+
+async def _monitor(retrasos, detener: asyncio.Event):
+    while not detener.is_set():
+        inicio = time.perf_counter()
+        await asyncio.sleep(INTERVALO_MONITOR)
+        retrasos.append(time.perf_counter() - inicio - INTERVALO_MONITOR)
+
+
+async def _login_bloqueante(contrasena, hash_guardado):
+    return pwd_context.verify(contrasena, hash_guardado)
+
+
+async def _login_pool(contrasena, hash_guardado):
+    return await verificar_contrasena(contrasena, hash_guardado)
+
+
+async def _rafaga(modo: str, logins: int, hash_guardado: str) -> dict:
+    login = _login_bloqueante if modo == "bloqueante" else _login_pool
+    retrasos = []
+    detener = asyncio.Event()
+    monitor = asyncio.create_task(_monitor(retrasos, detener))
+    await asyncio.sleep(0.05)
+
+    inicio = time.perf_counter()
+    resultados = await asyncio.gather(
+        *(login("secreta", hash_guardado) for _ in range(logins)), return_exceptions=True
+    )
+    duracion = time.perf_counter() - inicio
+
+    detener.set()
+    await monitor
+
+    rechazados = sum(1 for r in resultados if isinstance(r, HTTPException) and r.status_code == 503)
+    errores = sum(1 for r in resultados if isinstance(r, Exception)) - rechazados
+    retrasos_ms = sorted(r * 1000 for r in retrasos) or [0.0]
+    return {
+        "modo": modo,
+        "logins": logins,
+        "aceptados": logins - rechazados - errores,
+        "rechazados_503": rechazados,
+        "errores": errores,
+        "segundos": round(duracion, 2),
+        "retraso_p50_ms": round(statistics.median(retrasos_ms), 1),
+        "retraso_p99_ms": round(retrasos_ms[min(len(retrasos_ms) - 1, int(len(retrasos_ms) * 0.99))], 1),
+        "retraso_max_ms": round(retrasos_ms[-1], 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=40, help="Verificaciones simultáneas en la ráfaga")
+    parser.add_argument("--modo", choices=("ambos", "bloqueante", "pool"), default="ambos")
+    args = parser.parse_args()
+
+    hash_guardado = pwd_context.hash("secreta")
+    modos = ("bloqueante", "pool") if args.modo == "ambos" else (args.modo,)
+    for modo in modos:
+        print(asyncio.run(_rafaga(modo, args.logins, hash_guardado)))
+    print(obtener_metricas_hashing())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+"""
+Crea en una base de datos existente los índices declarados en los modelos que
+todavía no existan (create_all solo los crea junto con tablas nuevas).
+
+Uso (desde la raíz del proyecto):
+    python -m scripts.crear_indices
+"""
+
+from config.db import engine
+import models.personasModels
+import models.usersModels
+import models.rolesModels
+import models.usuarioRolesModels
+import models.sucursalesModels
+from models.transaccionsModels import Transaccion
+
+
+def main():
+    for indice in sorted(Transaccion.__table__.indexes, key=lambda i: i.name):
+        indice.create(bind=engine, checkfirst=True)
+        print(f"Índice verificado: {indice.name}")
+
+
+if __name__ == "__main__":
+    main()
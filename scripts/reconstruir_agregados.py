@@ -0,0 +1,38 @@
+"""
+Reconstruye los totales acumulados y los resúmenes por periodo de las
+transacciones a partir de la tabla completa.
+
+Uso (desde la raíz del proyecto):
+    python -m scripts.reconstruir_agregados
+"""
+
+from config.db import SessionLocal, engine, Base
+import models.personasModels
+import models.usersModels
+import models.rolesModels
+import models.usuarioRolesModels
+import models.sucursalesModels
+import models.transaccionsModels
+import models.estadisticasModels
+import models.resumenesModels
+from crud.estadisticasCrud import reconstruir_estadisticas
+from crud.resumenesCrud import reconstruir_resumenes
+
+
+def main():
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        estadisticas = reconstruir_estadisticas(db)
+        print(
+            f"Estadísticas reconstruidas: ingresos={estadisticas.total_ingresos}, "
+            f"egresos={estadisticas.total_egresos}, transacciones={estadisticas.transacciones_totales}"
+        )
+        intervalos = reconstruir_resumenes(db)
+        print(f"Resúmenes reconstruidos: {intervalos} intervalos")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Levanta varios procesos "worker" en esta máquina, cada uno con su propio
+ConnectionManager conectado al bus de sockets Unix, y comprueba que el cambio
+que publica cada worker llegue exactamente una vez a los clientes de todos los
+workers (incluido el suyo).
+
+También revisa que un mensaje demasiado grande para un datagrama llegue a los
+demás workers como aviso de recargar.
+
+Termina con código 1 si algún worker no recibe lo esperado, falla o no responde
+a tiempo, así que se puede usar como verificación automática (CI, hooks).
+
+Uso (desde la raíz del proyecto):
+    python -m scripts.verificar_bus_websocket
+    python -m scripts.verificar_bus_websocket --workers 8
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import queue
+import sys
+import tempfile
+import time
+
+from webSocket.bus import BusUnix, TAMANO_MAXIMO_DATAGRAMA
+from webSocket.websocket import ConnectionManager
+
+# Segundos máximos de espera por worker (arranque, barreras y resultados)
+TIEMPO_LIMITE = 30
+
+
+class ClientePrueba:
+    """
+    Imita un WebSocket y guarda lo que recibe.
+    """
+    def __init__(self):
+        self.recibidos = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, texto):
+        self.recibidos.append(json.loads(texto))
+
+    async def close(self, code=1000):
+        pass
+
+
+async def _worker(numero, directorio, barrera, resultados):
+    manager = ConnectionManager(bus=BusUnix(directorio), ventana_agrupacion=0)
+    cliente = ClientePrueba()
+    await manager.connect(cliente)
+    await manager.iniciar()
+
+    # Todos los workers deben estar escuchando antes de publicar
+    await asyncio.to_thread(barrera.wait)
+    await manager.broadcast({
+        "action": "transaccion_creada",
+        "transaccion": {"id": numero, "tipo_transaccion": "Ingreso", "metodo_pago": "Efectivo",
+                        "estatus": "Pagada", "usuario_id": 1},
+    })
+    if numero == 0:
+        await manager.broadcast({
+            "action": "transacciones_creadas",
+            "transacciones": [{"id": -1, "tipo_transaccion": "Egreso", "metodo_pago": "Efectivo",
+                               "estatus": "Pagada", "usuario_id": 1}],
+            "relleno": "x" * (TAMANO_MAXIMO_DATAGRAMA + 1),
+        })
+
+    await asyncio.sleep(1.0)
+    await asyncio.to_thread(barrera.wait)
+    await manager.detener()
+
+    resultados.put((numero, [
+        {"action": m["action"], "id": m.get("transaccion", {}).get("id")}
+        for m in cliente.recibidos if m["action"] != "conectado"
+    ]))
+
+
+def _proceso(numero, directorio, barrera, resultados):
+    asyncio.run(_worker(numero, directorio, barrera, resultados))
+
+
+def _recoger(procesos, resultados) -> dict:
+    """
+    Junta los resultados que lleguen antes del límite; un worker que falla o se
+    queda esperando simplemente no aparece y cuenta como falla.
+    """
+    recibidos = {}
+    limite = time.monotonic() + TIEMPO_LIMITE
+    while len(recibidos) < len(procesos):
+        restante = limite - time.monotonic()
+        if restante <= 0:
+            break
+        try:
+            numero, mensajes = resultados.get(timeout=min(restante, 1.0))
+            recibidos[numero] = mensajes
+        except queue.Empty:
+            if not any(proceso.is_alive() for proceso in procesos):
+                break
+    for proceso in procesos:
+        proceso.join(timeout=max(0.0, limite - time.monotonic()))
+        if proceso.is_alive():
+            proceso.terminate()
+            proceso.join()
+    return recibidos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4, help="Número de procesos a levantar")
+    args = parser.parse_args()
+
+    contexto = multiprocessing.get_context("spawn")
+    # Con tiempo límite: si un worker muere, los demás no esperan para siempre
+    barrera = contexto.Barrier(args.workers, timeout=TIEMPO_LIMITE)
+    resultados = contexto.Queue()
+
+    with tempfile.TemporaryDirectory() as directorio:
+        procesos = [
+            contexto.Process(target=_proceso, args=(i, directorio, barrera, resultados))
+            for i in range(args.workers)
+        ]
+        for proceso in procesos:
+            proceso.start()
+        recibidos = _recoger(procesos, resultados)
+
+    esperados = sorted(range(args.workers))
+    fallas = 0
+    for numero in esperados:
+        codigo = procesos[numero].exitcode
+        if numero not in recibidos or codigo != 0:
+            fallas += 1
+            print(f"[FALLA] worker {numero}: sin resultados (código de salida {codigo})")
+            continue
+        mensajes = recibidos[numero]
+        ids = sorted(m["id"] for m in mensajes if m["action"] == "transaccion_creada")
+        grandes = [m["action"] for m in mensajes if m["action"] != "transaccion_creada"]
+        esperado_grande = ["transacciones_creadas"] if numero == 0 else ["actualizar_transacciones"]
+        if ids == esperados and grandes == esperado_grande:
+            print(f"[OK]    worker {numero}: {len(ids)} cambios, mensaje grande como {grandes[0]}")
+        else:
+            fallas += 1
+            print(f"[FALLA] worker {numero}: ids {ids}, mensaje grande {grandes}")
+
+    print(f"{args.workers - fallas}/{args.workers} workers recibieron todos los cambios una sola vez")
+    return 1 if fallas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+"""
+Revisa con EXPLAIN el plan de la consulta de /obtener-todo para cada
+combinación de filtros y falla si alguna vuelve a recorrer toda la tabla de
+transacciones o a ordenar sin índice (filesort).
+
+Conviene ejecutarlo contra una base local con volumen realista (se puede
+poblar con seeders/transaccionesGenerador.py), porque con tablas casi vacías
+el optimizador puede preferir un recorrido completo aunque exista el índice.
+
+Uso (desde la raíz del proyecto):
+    python -m scripts.verificar_planes
+    python -m scripts.verificar_planes --url sqlite:///prueba.db
+"""
+
+import argparse
+import itertools
+import sys
+from datetime import datetime
+
+from sqlalchemy import create_engine
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+from config.db import engine as engine_configurado
+import models.personasModels
+import models.usersModels
+import models.rolesModels
+import models.usuarioRolesModels
+import models.sucursalesModels
+from models.transaccionsModels import TipoTransaccion, MetodoPago, EstatusTransaccion
+from crud.transaccionsCrud import consulta_paginada_transacciones, codificar_cursor
+
+TABLA = "tbb_transacciones"
+
+FECHA_INICIO = datetime(2024, 1, 1)
+FECHA_FIN = datetime(2024, 12, 31, 23, 59, 59)
+CURSOR = codificar_cursor(datetime(2024, 6, 1), 1000)
+
+# Valores de prueba de cada filtro; None significa "sin ese filtro". Se revisan
+# todas las combinaciones, no solo las que se usan hoy desde el frontend
+VALORES_FILTROS = {
+    "tipo_transaccion": (None, TipoTransaccion.INGRESO),
+    "metodo_pago": (None, MetodoPago.EFECTIVO),
+    "estatus": (None, EstatusTransaccion.PAGADA),
+    "usuario_id": (None, 1),
+    "fecha_inicio": (None, FECHA_INICIO),
+    "fecha_fin": (None, FECHA_FIN),
+    "cursor": (None, CURSOR),
+}
+
+
+def combinaciones():
+    """
+    Genera (nombre, parámetros) para cada combinación de filtros.
+    """
+    for valores in itertools.product(*VALORES_FILTROS.values()):
+        parametros = {
+            filtro: valor for filtro, valor in zip(VALORES_FILTROS, valores) if valor is not None
+        }
+        yield " + ".join(parametros) or "sin filtros", parametros
+
+
+class Explain(Executable, ClauseElement):
+    inherit_cache = False
+
+    def __init__(self, sentencia):
+        self.sentencia = sentencia
+
+
+@compiles(Explain)
+def _compilar_explain(elemento, compilador, **kw):
+    return "EXPLAIN " + compilador.process(elemento.sentencia, **kw)
+
+
+@compiles(Explain, "sqlite")
+def _compilar_explain_sqlite(elemento, compilador, **kw):
+    return "EXPLAIN QUERY PLAN " + compilador.process(elemento.sentencia, **kw)
+
+
+def _problemas_mysql(filas):
+    problemas = []
+    for fila in filas:
+        fila = fila._mapping
+        extra = fila.get("Extra") or ""
+        if fila.get("table") == TABLA and fila.get("type") == "ALL":
+            problemas.append(f"recorrido completo de {TABLA}")
+        if "Using filesort" in extra:
+            problemas.append(f"filesort en {fila.get('table')}")
+    return problemas
+
+
+def _problemas_sqlite(filas):
+    problemas = []
+    for fila in filas:
+        detalle = fila[-1]
+        if detalle.startswith(f"SCAN {TABLA}") and "INDEX" not in detalle:
+            problemas.append(f"recorrido completo de {TABLA}")
+        if "TEMP B-TREE FOR ORDER BY" in detalle:
+            problemas.append("ordenamiento sin índice")
+    return problemas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="URL de la base de datos (por defecto la de config.db)")
+    args = parser.parse_args()
+
+    engine = create_engine(args.url) if args.url else engine_configurado
+    dialecto = engine.dialect.name
+    if dialecto not in ("mysql", "sqlite"):
+        print(f"Motor no soportado por esta verificación: {dialecto}")
+        return 2
+    revisar = _problemas_mysql if dialecto == "mysql" else _problemas_sqlite
+
+    fallas = 0
+    total = 0
+    with Session(engine) as db:
+        for nombre, parametros in combinaciones():
+            total += 1
+            consulta = consulta_paginada_transacciones(db, **parametros)
+            filas = db.execute(Explain(consulta.statement)).fetchall()
+            problemas = revisar(filas)
+            if problemas:
+                fallas += 1
+                print(f"[FALLA] {nombre}: {', '.join(sorted(set(problemas)))}")
+                for fila in filas:
+                    print(f"        {tuple(fila)}")
+            else:
+                print(f"[OK]    {nombre}")
+
+    print(f"{total - fallas}/{total} planes sin recorridos completos ni filesort")
+    return 1 if fallas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,20 @@
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from models.estadisticasModels import EstadisticasTransacciones
+from models.transaccionsModels import Transaccion
+from crud.estadisticasCrud import ESTADISTICAS_ID, reconstruir_estadisticas
+
+# Siembra el registro único de totales: las altas de transacciones solo suman
+# sus deltas, así que el registro debe partir de los totales reales
+def seed_estadisticas(target, connection, **kwargs):
+    session = Session(bind=connection)
+    if inspect(connection).has_table(Transaccion.__tablename__):
+        reconstruir_estadisticas(session)
+    else:
+        session.add(EstadisticasTransacciones(
+            id=ESTADISTICAS_ID, total_ingresos=0, total_egresos=0, transacciones_totales=0
+        ))
+        session.commit()
+
+# Vincular el evento al momento de crear la tabla
+event.listen(EstadisticasTransacciones.__table__, "after_create", seed_estadisticas, once=True)
@@ -0,0 +1,188 @@
+"""
+Generador de transacciones ficticias para pruebas de carga.
+
+Es determinista: con la misma semilla, cantidad y fecha final produce
+exactamente las mismas filas. Inserta por lotes con INSERT de varias filas y
+ajusta los totales y resúmenes en la misma transacción de cada lote.
+
+Uso (desde la raíz del proyecto):
+    python -m seeders.transaccionesGenerador --cantidad 1000000 --semilla 42
+"""
+
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+import models.personasModels
+import models.usersModels
+import models.rolesModels
+import models.sucursalesModels
+from models.usuarioRolesModels import UsuarioRol
+from models.transaccionsModels import Transaccion, TipoTransaccion, MetodoPago, EstatusTransaccion
+from crud.agregadosCrud import aplicar_cambios, CambioTransaccion
+from crud.eventosCrud import registrar_evento
+from crud.transaccionsCrud import cache_balances
+
+# Proporciones aproximadas de la operación real del gimnasio
+PESOS_TIPO = {TipoTransaccion.INGRESO: 0.75, TipoTransaccion.EGRESO: 0.25}
+PESOS_METODO = {
+    MetodoPago.EFECTIVO: 0.35,
+    MetodoPago.TARJETA_DEBITO: 0.30,
+    MetodoPago.TARJETA_CREDITO: 0.20,
+    MetodoPago.TRANSFERENCIA: 0.15,
+}
+PESOS_ESTATUS = {
+    EstatusTransaccion.PAGADA: 0.85,
+    EstatusTransaccion.PROCESANDO: 0.07,
+    EstatusTransaccion.CANCELADA: 0.05,
+    EstatusTransaccion.RECHAZADA: 0.03,
+}
+
+# (detalle, monto mínimo, monto máximo)
+CONCEPTOS = {
+    TipoTransaccion.INGRESO: [
+        ("Pago de membresía mensual", 450, 900),
+        ("Pago de membresía anual", 4500, 9000),
+        ("Inscripción", 200, 500),
+        ("Venta de suplementos", 150, 1800),
+        ("Clase personalizada", 250, 600),
+        ("Venta de bebidas", 25, 120),
+    ],
+    TipoTransaccion.EGRESO: [
+        ("Pago de nómina", 6000, 18000),
+        ("Mantenimiento de equipo", 500, 8000),
+        ("Compra de suplementos para venta", 2000, 15000),
+        ("Servicios (luz, agua, internet)", 800, 6000),
+        ("Artículos de limpieza", 200, 1500),
+    ],
+}
+
+
+def _elegir(aleatorio: random.Random, pesos: dict):
+    return aleatorio.choices(list(pesos), weights=list(pesos.values()))[0]
+
+
+def _fila_aleatoria(aleatorio: random.Random, usuario_ids, fecha_inicio: datetime, segundos_rango: int) -> dict:
+    tipo_transaccion = _elegir(aleatorio, PESOS_TIPO)
+    detalle, minimo, maximo = aleatorio.choice(CONCEPTOS[tipo_transaccion])
+    return {
+        "usuario_id": aleatorio.choice(usuario_ids),
+        "detalles": detalle,
+        "tipo_transaccion": tipo_transaccion,
+        "metodo_pago": _elegir(aleatorio, PESOS_METODO),
+        "monto": round(aleatorio.uniform(minimo, maximo), 2),
+        "estatus": _elegir(aleatorio, PESOS_ESTATUS),
+        "fecha_registro": fecha_inicio + timedelta(seconds=aleatorio.randrange(segundos_rango)),
+        "fecha_actualizacion": None,
+    }
+
+
+def generar_transacciones(
+    db: Session,
+    cantidad: int,
+    semilla: int = 42,
+    tamano_lote: int = 5000,
+    fecha_fin: Optional[datetime] = None,
+    dias: int = 365,
+    progreso: Optional[Callable[[int, float], None]] = None
+) -> dict:
+    """
+    Inserta `cantidad` transacciones repartidas entre los usuarios con rol activo.
+    Devuelve cuántas filas se insertaron, el tiempo y las filas por segundo.
+    """
+    usuario_ids = [
+        r.Usuario_ID for r in db.query(UsuarioRol.Usuario_ID)
+        .filter(UsuarioRol.Estatus == True)
+        .order_by(UsuarioRol.Usuario_ID)
+        .distinct()
+    ]
+    if not usuario_ids:
+        raise ValueError("No hay usuarios con rol activo en 'tbd_usuarios_roles' para asignar transacciones.")
+
+    fecha_fin = fecha_fin or datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    fecha_inicio = fecha_fin - timedelta(days=dias)
+    segundos_rango = dias * 24 * 60 * 60
+    aleatorio = random.Random(semilla)
+
+    insertadas = 0
+    inicio = time.perf_counter()
+    while insertadas < cantidad:
+        filas = [
+            _fila_aleatoria(aleatorio, usuario_ids, fecha_inicio, segundos_rango)
+            for _ in range(min(tamano_lote, cantidad - insertadas))
+        ]
+        try:
+            db.execute(insert(Transaccion), filas)
+            aplicar_cambios(db, [
+                CambioTransaccion(
+                    fecha_registro=fila["fecha_registro"],
+                    tipo_transaccion=fila["tipo_transaccion"],
+                    metodo_pago=fila["metodo_pago"],
+                    estatus=fila["estatus"],
+                    monto=fila["monto"]
+                )
+                for fila in filas
+            ])
+            # Un evento por lote: quien se reconecte solo necesita saber que debe recargar
+            registrar_evento(db, "actualizar_transacciones", cantidad=len(filas))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        insertadas += len(filas)
+        if progreso:
+            progreso(insertadas, time.perf_counter() - inicio)
+
+    cache_balances.limpiar()
+
+    segundos = time.perf_counter() - inicio
+    return {
+        "insertadas": insertadas,
+        "segundos": round(segundos, 3),
+        "filas_por_segundo": round(insertadas / segundos, 1) if segundos else None,
+    }
+
+
+def main():
+    from config.db import SessionLocal, engine, Base
+
+    parser = argparse.ArgumentParser(description="Genera transacciones ficticias de forma determinista.")
+    parser.add_argument("--cantidad", type=int, required=True, help="Número de transacciones a generar")
+    parser.add_argument("--semilla", type=int, default=42, help="Semilla del generador aleatorio")
+    parser.add_argument("--lote", type=int, default=5000, help="Filas por INSERT/commit")
+    parser.add_argument("--hasta", type=lambda v: datetime.strptime(v, "%Y-%m-%d"), default=None,
+                        help="Fecha final del rango (YYYY-MM-DD); por defecto hoy")
+    parser.add_argument("--dias", type=int, default=365, help="Días que abarca el rango de fechas")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+
+    def progreso(insertadas, segundos):
+        print(f"{insertadas}/{args.cantidad} transacciones ({insertadas / segundos:,.0f} filas/s)")
+
+    db = SessionLocal()
+    try:
+        resultado = generar_transacciones(
+            db,
+            args.cantidad,
+            semilla=args.semilla,
+            tamano_lote=args.lote,
+            fecha_fin=args.hasta,
+            dias=args.dias,
+            progreso=progreso
+        )
+        print(
+            f"Se generaron {resultado['insertadas']} transacciones en {resultado['segundos']} s "
+            f"({resultado['filas_por_segundo']} filas/s)"
+        )
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""
+Módulo bus.py
+
+Backends para repartir los mensajes del websocket entre procesos. Con varios
+workers de uvicorn cada uno tiene sus propias conexiones: el worker que genera
+un cambio lo publica una vez en el bus y cada worker lo reenvía a sus clientes.
+
+- BusLocal (predeterminado): un solo proceso, entrega directa.
+- BusUnix: sockets Unix de datagramas en un directorio compartido; cada worker
+  escucha en su propio socket y publica a los sockets de los demás.
+
+El backend se elige con la variable de entorno WS_BUS ("local" o "unix") y,
+para "unix", el directorio con WS_BUS_DIR.
+"""
+
+import asyncio
+import glob
+import json
+import os
+import socket
+import tempfile
+from typing import Awaitable, Callable, Optional, Set
+
+Receptor = Callable[[dict], Awaitable[dict]]
+
+# Tamaño máximo de un datagrama; un mensaje más grande se reemplaza por un
+# aviso de recargar para los demás workers
+TAMANO_MAXIMO_DATAGRAMA = 60 * 1024
+# Aviso para un worker que perdió mensajes: sus clientes deben recargar todo
+DATAGRAMA_RESYNC = b'{"action":"resync"}'
+DIRECTORIO_BUS = os.path.join(tempfile.gettempdir(), "bulls_ws_bus")
+
+
+class BusLocal:
+    """
+    Entrega los mensajes solo a las conexiones de este proceso.
+    """
+    def __init__(self):
+        self._receptor: Optional[Receptor] = None
+        self.publicados = 0
+
+    def conectar(self, receptor: Receptor) -> None:
+        self._receptor = receptor
+
+    async def iniciar(self) -> None:
+        pass
+
+    async def detener(self) -> None:
+        pass
+
+    async def publicar(self, mensaje: dict) -> dict:
+        self.publicados += 1
+        return await self._receptor(mensaje)
+
+    def metricas(self) -> dict:
+        return {"tipo": "local", "publicados": self.publicados}
+
+
+class BusUnix(BusLocal):
+    """
+    Bus entre workers de la misma máquina con sockets Unix de datagramas.
+    """
+    def __init__(self, directorio: str = DIRECTORIO_BUS):
+        super().__init__()
+        self.directorio = directorio
+        self.ruta = os.path.join(directorio, f"{os.getpid()}.sock")
+        self._socket: Optional[socket.socket] = None
+        self._tareas: Set[asyncio.Task] = set()
+        # Workers a los que se les perdió un envío; reciben el aviso de resync
+        # antes del siguiente mensaje que sí se les pueda entregar
+        self._sin_sincronizar: Set[str] = set()
+        self.recibidos = 0
+        self.reenviados = 0
+        self.envios_fallidos = 0
+        self.reducidos = 0
+        self.resyncs_enviados = 0
+
+    async def iniciar(self) -> None:
+        os.makedirs(self.directorio, exist_ok=True)
+        if os.path.exists(self.ruta):
+            os.unlink(self.ruta)
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.bind(self.ruta)
+        self._socket.setblocking(False)
+        asyncio.get_running_loop().add_reader(self._socket.fileno(), self._leer)
+
+    async def detener(self) -> None:
+        if self._socket is None:
+            return
+        asyncio.get_running_loop().remove_reader(self._socket.fileno())
+        self._socket.close()
+        self._socket = None
+        if os.path.exists(self.ruta):
+            os.unlink(self.ruta)
+
+    def _leer(self) -> None:
+        while True:
+            try:
+                datos = self._socket.recv(TAMANO_MAXIMO_DATAGRAMA)
+            except (BlockingIOError, InterruptedError):
+                return
+            try:
+                mensaje = json.loads(datos)
+            except ValueError:
+                continue
+            self.recibidos += 1
+            tarea = asyncio.ensure_future(self._receptor(mensaje))
+            self._tareas.add(tarea)
+            tarea.add_done_callback(self._tareas.discard)
+
+    def _datagrama(self, mensaje: dict) -> bytes:
+        datos = json.dumps(mensaje, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+        if len(datos) <= TAMANO_MAXIMO_DATAGRAMA:
+            return datos
+        # Un lote muy grande no cabe en un datagrama: los otros workers solo
+        # avisan a sus clientes que recarguen, con los totales si los hay
+        self.reducidos += 1
+        reducido = {"action": "actualizar_transacciones"}
+        if mensaje.get("estadisticas"):
+            reducido["estadisticas"] = mensaje["estadisticas"]
+        return json.dumps(reducido, separators=(",", ":")).encode("utf-8")
+
+    def _enviar_a_otros(self, mensaje: dict) -> None:
+        datos = self._datagrama(mensaje)
+        for ruta in glob.glob(os.path.join(self.directorio, "*.sock")):
+            if ruta == self.ruta:
+                continue
+            try:
+                if ruta in self._sin_sincronizar:
+                    self._socket.sendto(DATAGRAMA_RESYNC, ruta)
+                    self._sin_sincronizar.discard(ruta)
+                    self.resyncs_enviados += 1
+                self._socket.sendto(datos, ruta)
+                self.reenviados += 1
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Socket de un worker que ya terminó
+                self._sin_sincronizar.discard(ruta)
+                try:
+                    os.unlink(ruta)
+                except OSError:
+                    pass
+            except OSError:
+                # Búfer del otro worker lleno u otro error: se pierde el envío y
+                # ese worker queda marcado para mandarle el aviso de resync
+                self.envios_fallidos += 1
+                self._sin_sincronizar.add(ruta)
+
+    async def publicar(self, mensaje: dict) -> dict:
+        if self._socket is not None:
+            self._enviar_a_otros(mensaje)
+        return await super().publicar(mensaje)
+
+    def metricas(self) -> dict:
+        return {
+            "tipo": "unix",
+            "directorio": self.directorio,
+            "workers": len(glob.glob(os.path.join(self.directorio, "*.sock"))),
+            "publicados": self.publicados,
+            "recibidos": self.recibidos,
+            "reenviados": self.reenviados,
+            "envios_fallidos": self.envios_fallidos,
+            "reducidos": self.reducidos,
+            "resyncs_enviados": self.resyncs_enviados,
+            "workers_sin_sincronizar": len(self._sin_sincronizar),
+        }
+
+
+def crear_bus(tipo: Optional[str] = None) -> BusLocal:
+    """
+    Crea el backend indicado o el de la variable de entorno WS_BUS.
+    """
+    tipo = (tipo or os.getenv("WS_BUS", "local")).lower()
+    if tipo == "local":
+        return BusLocal()
+    if tipo == "unix":
+        return BusUnix(os.getenv("WS_BUS_DIR", DIRECTORIO_BUS))
+    raise ValueError(f"Backend de websocket desconocido: {tipo}")
@@ -1,20 +1,489 @@
+import asyncio
+import itertools
+import json
+import logging
+from enum import Enum
 from fastapi import WebSocket, WebSocketDisconnect
-from typing import List
+from typing import Dict, List, Optional, Set, Tuple
+from webSocket.bus import BusLocal, crear_bus
+
+logger = logging.getLogger(__name__)
+
+# Tiempo máximo para entregar un mensaje a un cliente antes de expulsarlo
+TIMEOUT_ENVIO_SEGUNDOS = 2.0
+# Mensajes que puede tener pendientes cada conexión
+TAMANO_COLA = 100
+# Ventana en la que los cambios seguidos se juntan en un solo mensaje (0 = sin agrupar)
+VENTANA_AGRUPACION_SEGUNDOS = 0.15
+# Acciones que traen filas y se pueden juntar; cualquier otra obliga a recargar todo
+ACCIONES_DELTA = ("transaccion_creada", "transacciones_creadas", "transaccion_actualizada")
+# Campos por los que un cliente puede filtrar lo que recibe (los de /obtener-todo)
+CAMPOS_FILTRO = ("tipo_transaccion", "metodo_pago", "estatus", "usuario_id")
+# Las 16 combinaciones de campos fijos/comodín con que una fila puede coincidir
+_MASCARAS_FILTRO = list(itertools.product((True, False), repeat=len(CAMPOS_FILTRO)))
+
+class PoliticaDesborde(str, Enum):
+    DESCARTAR_ANTIGUO = "descartar_antiguo"  # Se pierde el mensaje más viejo de la cola
+    RESYNC = "resync"                        # La cola se reemplaza por un único aviso de resincronizar
+    DESCONECTAR = "desconectar"              # Se cierra la conexión del cliente lento
+
+# Marca en la cola del aviso de resync, que reemplaza a los mensajes descartados
+AVISO_RESYNC = object()
+
+def _clave_filtro(filtros: dict) -> tuple:
+    return tuple(filtros.get(campo) for campo in CAMPOS_FILTRO)
+
+def _coincide(clave_filtro: tuple, fila: dict) -> bool:
+    return all(filtro is None or filtro == valor for filtro, valor in zip(clave_filtro, _clave_filtro(fila)))
+
+def _diferencia_estadisticas(anteriores: Optional[dict], actuales: Optional[dict]) -> Optional[dict]:
+    if not anteriores or not actuales:
+        return None
+    return {clave: actuales[clave] - anteriores.get(clave, 0) for clave in actuales}
+
+def combinar_mensajes(mensajes: List[dict], estadisticas_previas: Optional[dict] = None) -> dict:
+    """
+    Junta los mensajes de una ventana en uno solo con las filas nuevas y
+    actualizadas (la versión más reciente de cada una), los totales finales y
+    el cambio neto de los totales respecto al último mensaje enviado.
+    """
+    if len(mensajes) == 1:
+        return mensajes[0]
+
+    estadisticas = next(
+        (m["estadisticas"] for m in reversed(mensajes) if m.get("estadisticas")), None
+    )
+    # El evento más reciente de la bandeja de salida que cubre el mensaje
+    event_id = max((m["event_id"] for m in mensajes if m.get("event_id") is not None), default=None)
+    if any(m.get("action") not in ACCIONES_DELTA for m in mensajes):
+        return {"action": "actualizar_transacciones", "estadisticas": estadisticas, "event_id": event_id}
+
+    filas: Dict[int, dict] = {}
+    ids_creados: List[int] = []
+    ids_actualizados: List[int] = []
+    for mensaje in mensajes:
+        for fila in mensaje.get("transacciones") or [mensaje["transaccion"]]:
+            filas[fila["id"]] = fila
+            if mensaje["action"] != "transaccion_actualizada":
+                ids_creados.append(fila["id"])
+            elif fila["id"] not in ids_creados and fila["id"] not in ids_actualizados:
+                ids_actualizados.append(fila["id"])
+
+    return {
+        "action": "transacciones_agrupadas",
+        "ids_creados": ids_creados,
+        "ids_actualizados": ids_actualizados,
+        "transacciones": list(filas.values()),
+        "estadisticas": estadisticas,
+        "delta_estadisticas": _diferencia_estadisticas(estadisticas_previas, estadisticas),
+        "event_id": event_id,
+    }
+
+def _mensaje_parcial(message: dict, filas: List[dict], indices: List[int]) -> dict:
+    """
+    Copia del mensaje con solo las filas indicadas (y sus ids).
+    """
+    if len(indices) == len(filas):
+        return message
+    parcial = {**message, "transacciones": [filas[i] for i in indices]}
+    ids = {filas[i]["id"] for i in indices}
+    for clave in ("ids_creados", "ids_actualizados"):
+        if clave in message:
+            parcial[clave] = [i for i in message[clave] if i in ids]
+    return parcial
+
+class ConexionCliente:
+    """
+    Conexión de un cliente con su cola de salida y la tarea que la vacía.
+
+    La cola guarda pares (seq, texto). La secuencia es propia de cada conexión,
+    así un cliente con filtros no confunde los mensajes que no le tocan con
+    mensajes perdidos.
+    """
+    def __init__(self, websocket: WebSocket, tamano_cola: int):
+        self.websocket = websocket
+        self.cola: asyncio.Queue = asyncio.Queue(maxsize=tamano_cola)
+        self.secuencia = 0
+        # Filtros de la suscripción; sin filtros recibe todo
+        self.clave_filtro: tuple = _clave_filtro({})
+        # Mientras se reenvían eventos perdidos, los mensajes nuevos esperan aquí
+        # como (event_id, texto) para no llegar antes que los viejos
+        self.en_espera: Optional[List[Tuple[Optional[int], str]]] = None
+        self.tarea: Optional[asyncio.Task] = None
+        # Mientras el aviso de resync no salga de la cola, los mensajes nuevos sobran
+        self.resync_pendiente = False
+        self.entregados = 0
+        self.descartados = 0
+        self.resyncs = 0
 
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
+    def __init__(
+        self,
+        timeout_envio: float = TIMEOUT_ENVIO_SEGUNDOS,
+        tamano_cola: int = TAMANO_COLA,
+        politica: PoliticaDesborde = PoliticaDesborde.RESYNC,
+        ventana_agrupacion: float = VENTANA_AGRUPACION_SEGUNDOS,
+        bus: Optional[BusLocal] = None
+    ):
+        self.conexiones: Dict[WebSocket, ConexionCliente] = {}
+        # Índice de suscripciones: filtros (None = comodín) -> conexiones
+        self._suscripciones: Dict[tuple, Set[ConexionCliente]] = {}
+        # Mensajes difundidos desde que arrancó el proceso
+        self.secuencia = 0
+        self.ventana_agrupacion = ventana_agrupacion
+        self._pendientes: List[dict] = []
+        self._tarea_ventana: Optional[asyncio.Task] = None
+        self._ultimas_estadisticas: Optional[dict] = None
+        self.mensajes_agrupados = 0
+        self.timeout_envio = timeout_envio
+        self.tamano_cola = tamano_cola
+        self.politica = PoliticaDesborde(politica)
+        # Contadores acumulados desde que arrancó el proceso
+        self.entregados = 0
+        self.fallidos = 0
+        self.expulsados = 0
+        self.descartados = 0
+        self.resyncs = 0
+        self.usar_bus(bus or BusLocal())
+
+    def usar_bus(self, bus: BusLocal) -> None:
+        """
+        Define el backend por el que se publican los mensajes; lo que llega por
+        el bus se difunde a las conexiones de este proceso.
+        """
+        bus.conectar(self.difundir_local)
+        self.bus = bus
+
+    async def iniciar(self) -> None:
+        await self.bus.iniciar()
+
+    async def detener(self) -> None:
+        await self.bus.detener()
+
+    @property
+    def active_connections(self) -> List[WebSocket]:
+        return list(self.conexiones)
 
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
-        self.active_connections.append(websocket)
+        conexion = ConexionCliente(websocket, self.tamano_cola)
+        # Secuencia inicial: a partir de aquí el cliente espera seq + 1
+        conexion.cola.put_nowait((0, self._serializar({"action": "conectado"})))
+        self.conexiones[websocket] = conexion
+        self._suscripciones.setdefault(conexion.clave_filtro, set()).add(conexion)
+        conexion.tarea = asyncio.create_task(self._escritor(conexion))
+
+    def suscribir(self, websocket: WebSocket, filtros: dict) -> bool:
+        """
+        Reemplaza los filtros de la conexión; los campos ausentes o None
+        aceptan cualquier valor.
+        """
+        conexion = self.conexiones.get(websocket)
+        if conexion is None:
+            return False
+        self._quitar_suscripcion(conexion)
+        conexion.clave_filtro = _clave_filtro(filtros)
+        self._suscripciones.setdefault(conexion.clave_filtro, set()).add(conexion)
+        return True
+
+    async def enviar(self, websocket: WebSocket, message: dict) -> None:
+        """
+        Encola un mensaje solo para una conexión (respuestas a lo que envió el cliente).
+        """
+        conexion = self.conexiones.get(websocket)
+        if conexion is not None and not self._encolar(conexion, self._serializar(message)):
+            await self._expulsar(conexion)
+
+    def iniciar_reproduccion(self, websocket: WebSocket) -> None:
+        """
+        A partir de aquí los mensajes nuevos para la conexión se retienen hasta
+        terminar_reproduccion, para que lleguen después de los eventos perdidos.
+        """
+        conexion = self.conexiones.get(websocket)
+        if conexion is not None and conexion.en_espera is None:
+            conexion.en_espera = []
+
+    async def terminar_reproduccion(
+        self, websocket: WebSocket, mensajes: Optional[List[dict]], ultimo_evento_id: int, estadisticas: Optional[dict] = None
+    ) -> None:
+        """
+        Encola los eventos perdidos que coinciden con los filtros de la conexión
+        y luego los mensajes retenidos que no repiten alguno de ellos. Con
+        `mensajes` None (ya no se pueden reconstruir) se pide recargar todo.
+
+        Los retenidos se comparan por id y no contra el mayor reproducido: un
+        evento con id menor puede confirmarse después de la consulta.
+        """
+        conexion = self.conexiones.get(websocket)
+        if conexion is None:
+            return
+        en_espera, conexion.en_espera = conexion.en_espera or [], None
+
+        if mensajes is None:
+            # La recarga ya incluye lo retenido
+            if not self._encolar(conexion, self._serializar({"action": "resync"})):
+                await self._expulsar(conexion)
+            return
+
+        textos = [texto for texto in (self._texto_para(conexion, m) for m in mensajes) if texto]
+        reproducidos = {m["event_id"] for m in mensajes}
+        ultimo_evento_id = max([ultimo_evento_id, *reproducidos])
+        textos += [texto for event_id, texto in en_espera if event_id not in reproducidos]
+        textos.append(self._serializar({
+            "action": "reproduccion_completa",
+            "event_id": ultimo_evento_id,
+            "estadisticas": estadisticas,
+        }))
+        for texto in textos:
+            if not self._encolar(conexion, texto):
+                await self._expulsar(conexion)
+                return
+
+    def _texto_para(self, conexion: ConexionCliente, message: dict) -> Optional[str]:
+        """
+        Texto del mensaje para una sola conexión según sus filtros; None si no le toca.
+        """
+        filas = [message["transaccion"]] if "transaccion" in message else message.get("transacciones")
+        if filas is None:
+            return self._serializar(message)
+        indices = [i for i, fila in enumerate(filas) if _coincide(conexion.clave_filtro, fila)]
+        if not indices:
+            return None
+        if "transaccion" in message:
+            return self._serializar(message)
+        return self._serializar(_mensaje_parcial(message, filas, indices))
+
+    def _quitar_suscripcion(self, conexion: ConexionCliente) -> None:
+        suscritos = self._suscripciones.get(conexion.clave_filtro)
+        if suscritos is not None:
+            suscritos.discard(conexion)
+            if not suscritos:
+                del self._suscripciones[conexion.clave_filtro]
+
+    def _interesados(self, fila: dict) -> Set[ConexionCliente]:
+        """
+        Conexiones cuyos filtros coinciden con la fila: se consulta el índice con
+        cada combinación de campos fijos/comodín, sin recorrer todas las conexiones.
+        """
+        valores = _clave_filtro(fila)
+        interesados: Set[ConexionCliente] = set()
+        for mascara in _MASCARAS_FILTRO:
+            clave = tuple(valor if fijo else None for valor, fijo in zip(valores, mascara))
+            suscritos = self._suscripciones.get(clave)
+            if suscritos:
+                interesados.update(suscritos)
+        return interesados
+
+    @staticmethod
+    def _serializar(message: dict) -> str:
+        return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+    def _quitar(self, websocket: WebSocket) -> Optional[ConexionCliente]:
+        conexion = self.conexiones.pop(websocket, None)
+        if conexion is not None:
+            self._quitar_suscripcion(conexion)
+        return conexion
+
+    def disconnect(self, websocket: WebSocket) -> bool:
+        conexion = self._quitar(websocket)
+        if conexion is None:
+            return False
+        if conexion.tarea and conexion.tarea is not asyncio.current_task():
+            conexion.tarea.cancel()
+        return True
+
+    async def _cerrar(self, websocket: WebSocket) -> None:
+        try:
+            await asyncio.wait_for(websocket.close(code=1011), timeout=self.timeout_envio)
+        except Exception:
+            pass
+
+    async def _expulsar(self, conexion: ConexionCliente) -> None:
+        if self.disconnect(conexion.websocket):
+            self.expulsados += 1
+            await self._cerrar(conexion.websocket)
+
+    async def _escritor(self, conexion: ConexionCliente) -> None:
+        """
+        Envía en orden los mensajes de la cola de una conexión. Si un envío falla
+        o excede el tiempo límite, la conexión se expulsa.
+        """
+        while True:
+            seq, texto = await conexion.cola.get()
+            if texto is AVISO_RESYNC:
+                conexion.resync_pendiente = False
+                texto = self._serializar({"action": "resync"})
+            # Se agrega "seq" al objeto JSON ya serializado
+            texto = f'{texto[:-1]},"seq":{seq}}}'
+            try:
+                await asyncio.wait_for(conexion.websocket.send_text(texto), timeout=self.timeout_envio)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.fallidos += 1
+                await self._expulsar(conexion)
+                return
+            conexion.entregados += 1
+            self.entregados += 1
+
+    def _encolar(self, conexion: ConexionCliente, texto: str) -> bool:
+        """
+        Agrega el mensaje a la cola de la conexión aplicando la política de
+        desborde. Devuelve False si la conexión debe expulsarse.
+        """
+        if conexion.resync_pendiente:
+            conexion.descartados += 1
+            self.descartados += 1
+            return True
+
+        conexion.secuencia += 1
+        try:
+            conexion.cola.put_nowait((conexion.secuencia, texto))
+            return True
+        except asyncio.QueueFull:
+            pass
+
+        if self.politica == PoliticaDesborde.DESCONECTAR:
+            return False
+
+        if self.politica == PoliticaDesborde.DESCARTAR_ANTIGUO:
+            conexion.cola.get_nowait()
+            conexion.cola.put_nowait((conexion.secuencia, texto))
+            conexion.descartados += 1
+            self.descartados += 1
+            return True
+
+        # RESYNC: los mensajes pendientes ya no sirven, el cliente recargará todo
+        descartados = conexion.cola.qsize() + 1
+        while not conexion.cola.empty():
+            conexion.cola.get_nowait()
+        conexion.cola.put_nowait((conexion.secuencia, AVISO_RESYNC))
+        conexion.resync_pendiente = True
+        conexion.descartados += descartados
+        conexion.resyncs += 1
+        self.descartados += descartados
+        self.resyncs += 1
+        return True
+
+    async def broadcast(self, message: dict) -> dict:
+        """
+        Publica el mensaje en el bus una sola vez; cada proceso (incluido este)
+        lo difunde a sus propias conexiones.
+        """
+        return await self.bus.publicar(message)
+
+    async def difundir_local(self, message: dict) -> dict:
+        """
+        Difunde el mensaje agrupando las ráfagas: si no se envió nada en la
+        ventana actual sale de inmediato; si no, se junta con los demás cambios
+        de la ventana y se envía uno solo al cerrarla.
+        """
+        if self.ventana_agrupacion <= 0:
+            return await self._difundir(message)
+
+        if self._tarea_ventana is not None and not self._tarea_ventana.done():
+            self._pendientes.append(message)
+            return {"agrupado": True}
+
+        resultado = await self._difundir(message)
+        self._tarea_ventana = asyncio.create_task(self._cerrar_ventanas())
+        return resultado
+
+    async def _cerrar_ventanas(self) -> None:
+        """
+        Al terminar cada ventana envía lo acumulado; si no hubo cambios la
+        ventana se cierra y el siguiente mensaje vuelve a salir de inmediato.
+        """
+        while True:
+            await asyncio.sleep(self.ventana_agrupacion)
+            if not self._pendientes:
+                return
+            mensajes, self._pendientes = self._pendientes, []
+            self.mensajes_agrupados += len(mensajes)
+            try:
+                await self._difundir(combinar_mensajes(mensajes, self._ultimas_estadisticas))
+            except Exception:
+                logger.exception("Error al enviar los cambios agrupados")
+
+    def _destinos(self, message: dict) -> Dict[ConexionCliente, str]:
+        """
+        Texto que le corresponde a cada conexión interesada. Los mensajes con
+        filas llegan solo a los clientes cuyos filtros coinciden con alguna, y
+        cada uno recibe únicamente esas filas; el resto de los mensajes llega a
+        todos. Cada variante distinta se serializa una sola vez.
+        """
+        if "transaccion" in message:
+            interesados = self._interesados(message["transaccion"])
+            texto = self._serializar(message)
+            return {conexion: texto for conexion in interesados}
+
+        filas = message.get("transacciones")
+        if filas is None:
+            texto = self._serializar(message)
+            return {conexion: texto for conexion in self.conexiones.values()}
+
+        indices_por_conexion: Dict[ConexionCliente, List[int]] = {}
+        for indice, fila in enumerate(filas):
+            for conexion in self._interesados(fila):
+                indices_por_conexion.setdefault(conexion, []).append(indice)
+
+        textos: Dict[Tuple[int, ...], str] = {}
+        destinos: Dict[ConexionCliente, str] = {}
+        for conexion, indices in indices_por_conexion.items():
+            clave = tuple(indices)
+            if clave not in textos:
+                textos[clave] = self._serializar(_mensaje_parcial(message, filas, indices))
+            destinos[conexion] = textos[clave]
+        return destinos
+
+    async def _difundir(self, message: dict) -> dict:
+        """
+        Encola el mensaje para los clientes interesados y regresa de inmediato;
+        la tarea de cada conexión se encarga de enviarlo.
+
+        Devuelve cuántas conexiones lo encolaron y cuántas se expulsaron por
+        tener la cola llena (política "desconectar").
+        """
+        if message.get("estadisticas"):
+            self._ultimas_estadisticas = message["estadisticas"]
+        self.secuencia += 1
+
+        encolados = 0
+        lentas = []
+        for conexion, texto in self._destinos(message).items():
+            if conexion.en_espera is not None:
+                conexion.en_espera.append((message.get("event_id"), texto))
+                encolados += 1
+            elif self._encolar(conexion, texto):
+                encolados += 1
+            else:
+                lentas.append(conexion)
+
+        for conexion in lentas:
+            await self._expulsar(conexion)
 
-    def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
+        return {"encolados": encolados, "expulsados": len(lentas)}
 
-    async def broadcast(self, message: dict):
-        for connection in self.active_connections:
-            await connection.send_json(message)
+    def metricas(self) -> dict:
+        profundidades = [c.cola.qsize() for c in self.conexiones.values()]
+        return {
+            "conexiones_activas": len(self.conexiones),
+            "conexiones_con_filtros": len(self.conexiones) - len(self._suscripciones.get(_clave_filtro({}), ())),
+            "combinaciones_de_filtros": len(self._suscripciones),
+            "secuencia": self.secuencia,
+            "politica_desborde": self.politica.value,
+            "tamano_cola": self.tamano_cola,
+            "profundidad_total": sum(profundidades),
+            "profundidad_maxima": max(profundidades, default=0),
+            "entregados": self.entregados,
+            "fallidos": self.fallidos,
+            "expulsados": self.expulsados,
+            "descartados": self.descartados,
+            "resyncs": self.resyncs,
+            "ventana_agrupacion": self.ventana_agrupacion,
+            "mensajes_agrupados": self.mensajes_agrupados,
+            "pendientes_agrupacion": len(self._pendientes),
+            "bus": self.bus.metricas(),
+        }
 
-manager = ConnectionManager()
+manager = ConnectionManager(bus=crear_bus())